@@ -3,24 +3,12 @@
 
 import sys
 import os
-import importlib.util
 
-# Get the absolute path to the backend directory
-backend_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+# Backend modules import each other as top-level modules (database, engines, rag)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
 
-# Add the backend directory to sys.path FIRST
-sys.path.insert(0, backend_path)
-
-# Change working directory to backend for relative imports within backend
-os.chdir(backend_path)
-
-# Load backend/app.py using importlib to avoid circular import
-spec = importlib.util.spec_from_file_location("backend_app", os.path.join(backend_path, "app.py"))
-backend_module = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(backend_module)
-
-# Get the Flask app from the loaded module
-app = backend_module.app
+# Import through the backend package so the app module is only loaded once
+from backend.app import app
 
 # This allows gunicorn to find the app with: gunicorn app:app
 if __name__ == '__main__':
@@ -5,30 +5,55 @@ Offline-first backend with API key authentication
 
 import os
 import json
-from functools import wraps
-from flask import Flask, request, jsonify
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import wraps, cache
+from flask import Flask, Response, request, jsonify, g, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from pathlib import Path
 
+# orjson is optional; Flask's stdlib JSON provider is used without it
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
 # Import local modules
+from cache import TTLCache
 from database import (
     create_user, authenticate_user, get_user_by_api_key,
-    get_all_courses, get_course, create_course,
-    get_user_progress, update_progress, get_or_create_progress,
-    save_quiz, submit_quiz, get_quiz_history,
+    get_all_courses, get_course, get_course_count, create_courses,
+    get_user_progress, get_progress_summary_by_user, get_progress_with_averages,
+    get_topic_mastery, update_progress_batch, set_topic_mastery, get_weak_topics,
+    save_quiz, submit_quiz, get_quiz_by_id, get_completed_quizzes,
     save_study_plan, get_latest_study_plan
 )
-from engines import (
-    BayesianKnowledgeTracer, BKTParams, update_topic_mastery,
-    QuizGenerator, RoadmapGenerator
-)
-from rag import VectorRetriever, AnswerGenerator, DocumentIngester
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson for faster request/response bodies."""
+    
+    # Dates go through Flask's default() so they stay HTTP-date strings,
+    # as with the stdlib provider, instead of orjson's ISO 8601
+    OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+               if HAS_ORJSON else 0)
+    
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=self.default, option=self.OPTIONS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 
 # Initialize Flask app
 app = Flask(__name__)
+if HAS_ORJSON:
+    app.json = ORJSONProvider(app)
 
-# CORS Configuration - Add your production domains here
-CORS(app, origins=[
+# CORS Configuration - Add your production domains here,
+# or set CORS_ORIGINS to a comma-separated list to replace them
+DEFAULT_CORS_ORIGINS = [
     "http://localhost:5173",
     "http://localhost:3000",
     "http://127.0.0.1:5173",
@@ -36,22 +61,111 @@ CORS(app, origins=[
     # Production domains
     "https://study-pilot-ai-liart.vercel.app",  # Your Vercel frontend
     "https://*.vercel.app",  # Allows all Vercel preview deployments
-    os.environ.get("FRONTEND_URL", "")  # Custom frontend URL from env
-], supports_credentials=True)
+]
+
+
+def get_cors_origins() -> list:
+    """Allowed CORS origins from CORS_ORIGINS/FRONTEND_URL, else the defaults."""
+    env_origins = os.environ.get('CORS_ORIGINS', '')
+    origins = [o.strip() for o in env_origins.split(',') if o.strip()] or list(DEFAULT_CORS_ORIGINS)
+    
+    frontend_url = os.environ.get("FRONTEND_URL")  # Custom frontend URL from env
+    if frontend_url:
+        origins.append(frontend_url)
+    return origins
+
+
+CORS(app, origins=get_cors_origins(), supports_credentials=True)
 
-# Initialize components
+# Data locations
 DATA_PATH = Path(__file__).parent / "data"
 COURSES_PATH = DATA_PATH / "courses"
 
-quiz_generator = QuizGenerator(COURSES_PATH)
-roadmap_generator = RoadmapGenerator(COURSES_PATH)
-retriever = VectorRetriever()
-answer_generator = AnswerGenerator(retriever)
-bkt = BayesianKnowledgeTracer()
+
+# ============ Lazy Components ============
+# Engines and the RAG stack (numpy, optional FAISS/sentence-transformers) are
+# imported and built on first use so worker start-up stays cheap.
+
+@cache
+def _get_quiz_generator():
+    from engines import QuizGenerator
+    return QuizGenerator(COURSES_PATH)
+
+
+@cache
+def _get_roadmap_generator():
+    from engines import RoadmapGenerator
+    return RoadmapGenerator(COURSES_PATH)
+
+
+@cache
+def _get_bkt():
+    from engines import BayesianKnowledgeTracer
+    return BayesianKnowledgeTracer()
+
+
+@cache
+def _get_retriever():
+    from rag import VectorRetriever
+    return VectorRetriever()
+
+
+@cache
+def _get_answer_generator():
+    from rag import AnswerGenerator
+    return AnswerGenerator(_get_retriever())
+
+
+_LAZY_COMPONENTS = {
+    'quiz_generator': _get_quiz_generator,
+    'roadmap_generator': _get_roadmap_generator,
+    'bkt': _get_bkt,
+    'retriever': _get_retriever,
+    'answer_generator': _get_answer_generator,
+}
+
+
+def warm_components():
+    """
+    Build the read-only engines and parse the course JSON up front.
+
+    Called from the gunicorn master when the app is preloaded so forked
+    workers share the result copy-on-write. The retriever stays lazy:
+    loading sentence-transformers/torch starts threads, which do not
+    survive a fork.
+    """
+    _get_bkt()
+    _get_quiz_generator()
+    roadmap_generator = _get_roadmap_generator()
+    for course_file in COURSES_PATH.glob("*.json"):
+        roadmap_generator.load_course_data(course_file.stem)
+
+
+def __getattr__(name):
+    """Resolve the old module-level component names on first access (PEP 562)."""
+    if name in _LAZY_COMPONENTS:
+        return _LAZY_COMPONENTS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # ============ Authentication Middleware ============
 
+# Resolved API keys are cached briefly so repeat requests skip the users lookup
+_user_cache = TTLCache(maxsize=1024, ttl=60)
+
+
+def resolve_api_key(api_key: str) -> dict:
+    """Look up the user for an API key, using the in-process TTL cache."""
+    user = _user_cache.get(api_key)
+    if user:
+        return user
+    
+    user = get_user_by_api_key(api_key)
+    if user:
+        _user_cache.set(api_key, user)
+    return user
+
+
 def require_auth(f):
     """Decorator to require API key authentication."""
     @wraps(f)
@@ -61,12 +175,12 @@ def require_auth(f):
         if not api_key:
             return jsonify({'error': 'API key required'}), 401
         
-        user = get_user_by_api_key(api_key)
+        user = resolve_api_key(api_key)
         if not user:
             return jsonify({'error': 'Invalid API key'}), 401
         
         # Add user to request context
-        request.user = user
+        g.user = user
         return f(*args, **kwargs)
     
     return decorated
@@ -151,21 +265,38 @@ def demo_login():
 
 # ============ Course Endpoints ============
 
+# The course catalog rarely changes, so it is cached for a few minutes
+_course_cache = TTLCache(maxsize=1, ttl=300)
+
+
+def _cached_courses() -> list:
+    """Get all courses, served from the in-process catalog cache."""
+    courses = _course_cache.get('all')
+    if courses is None:
+        courses = get_all_courses()
+        _course_cache.set('all', courses)
+    
+    # Callers decorate the course dicts, so hand out copies
+    return [dict(c) for c in courses]
+
+
+def _invalidate_course_cache():
+    """Drop the cached catalog after courses are created."""
+    _course_cache.clear()
+
+
 @app.route('/api/courses', methods=['GET'])
 @require_auth
 def list_courses():
     """List all available courses."""
-    courses = get_all_courses()
+    courses = _cached_courses()
     
     # Add progress for current user
-    user_id = request.user['id']
+    user_id = g.user['id']
+    summary = get_progress_summary_by_user(user_id)
     for course in courses:
-        progress = get_user_progress(user_id, course['id'])
-        if progress:
-            avg_mastery = sum(p['mastery_level'] for p in progress) / len(progress)
-            course['progress'] = round(avg_mastery * 100, 1)
-        else:
-            course['progress'] = 0
+        avg_mastery = summary.get(course['id'])
+        course['progress'] = round(avg_mastery * 100, 1) if avg_mastery is not None else 0
     
     return jsonify({'courses': courses})
 
@@ -180,7 +311,7 @@ def get_course_detail(course_id):
         return jsonify({'error': 'Course not found'}), 404
     
     # Add user progress for each topic
-    user_id = request.user['id']
+    user_id = g.user['id']
     progress_list = get_user_progress(user_id, course_id)
     progress_map = {p['topic_id']: p for p in progress_list}
     
@@ -215,6 +346,7 @@ def generate_roadmap():
     
     # Load full course data from JSON
     course_code = course.get('code', 'unknown')
+    roadmap_generator = _get_roadmap_generator()
     course_data = roadmap_generator.load_course_data(course_code)
     
     if not course_data:
@@ -226,7 +358,7 @@ def generate_roadmap():
         }
     
     # Get current mastery levels
-    user_id = request.user['id']
+    user_id = g.user['id']
     progress = get_user_progress(user_id, course_id)
     topic_mastery = {p['topic_id']: p['mastery_level'] for p in progress}
     
@@ -253,7 +385,7 @@ def generate_roadmap():
 @require_auth
 def get_roadmap(course_id):
     """Get the latest study plan for a course."""
-    user_id = request.user['id']
+    user_id = g.user['id']
     plan = get_latest_study_plan(user_id, course_id)
     
     if not plan:
@@ -262,25 +394,61 @@ def get_roadmap(course_id):
     return jsonify(plan)
 
 
-from knowledge_base import get_smart_answer
-from rag.cloud_llm import get_openai_answer
-import os
-
 # Manual .env loader to avoid adding dependencies
 def load_env_file():
+    """Load backend/.env for local runs without overriding real env vars."""
+    # Render injects variables (and secrets) itself
+    if os.environ.get('RENDER'):
+        return
+    
     env_path = os.path.join(os.path.dirname(__file__), '.env')
     if os.path.exists(env_path):
         with open(env_path, 'r') as f:
             for line in f:
                 if '=' in line and not line.startswith('#'):
                     key, value = line.strip().split('=', 1)
-                    os.environ[key] = value
-
-# Load environment variables on startup
-load_env_file()
+                    os.environ.setdefault(key, value)
 
 # ============ Query/RAG Endpoints ============
 
+# Reply used when neither the knowledge base nor RAG has anything relevant
+FALLBACK_ANSWER = (
+    "I don't have specific information about '{query}' in my knowledge base yet. "
+    "Try asking about topics like:\n\n"
+    "• Data structures (trees, graphs, sorting)\n"
+    "• Signals (Fourier, Laplace, filters)\n"
+    "• Thermodynamics (entropy, Carnot cycle)\n"
+    "• DSP (FFT, FIR/IIR filters)\n\n"
+    "You can also upload PDF or slides for me to learn from!"
+)
+FALLBACK_RESULT = {'citations': (), 'confidence': 0.5, 'sources': ()}
+
+# Bounds the number of in-flight OpenAI requests across worker threads
+CLOUD_LLM_TIMEOUT = 25  # seconds
+_llm_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix='cloud-llm')
+
+# Retrieved course context for cloud answers, keyed by (query hash, course_id)
+_context_cache = TTLCache(maxsize=256, ttl=300)
+
+
+def _get_cloud_context(query: str, course_id: int = None) -> str:
+    """Get raw course chunks to ground a cloud answer, or '' when not useful."""
+    # Only ground course-specific questions, and only if anything is indexed
+    if course_id is None or len(query) <= 30:
+        return ""
+    
+    key = (hashlib.sha1(query.encode('utf-8')).hexdigest(), course_id)
+    context = _context_cache.get(key)
+    if context is None:
+        retriever = _get_retriever()
+        context = ""
+        if retriever.size:
+            context = retriever.search_with_context(query, top_k=3, course_id=course_id)['context']
+        _context_cache.set(key, context)
+    
+    return context
+
+
 @app.route('/api/query', methods=['POST'])
 @require_auth
 def answer_query():
@@ -296,39 +464,119 @@ def answer_query():
     # 1. Try Cloud LLM (ChatGPT) if API Key exists
     # This gives the "ChatGPT-like" experience the user requested
     if os.environ.get('OPENAI_API_KEY'):
+        from rag.cloud_llm import get_openai_answer
+        
         # Extract history from request
         history = data.get('history', [])
         
         # Get optional context from RAG for the cloud model to use
-        rag_result = answer_generator.answer(query, course_id)
-        context = rag_result.get('answer', '') if rag_result else ""
+        context = _get_cloud_context(query, course_id)
+        
+        future = _llm_pool.submit(get_openai_answer, query, context, history)
+        try:
+            cloud_answer = future.result(timeout=CLOUD_LLM_TIMEOUT)
+        except FutureTimeoutError:
+            print("Cloud LLM request timed out")
+            cloud_answer = None
         
-        cloud_answer = get_openai_answer(query, context, history)
         if cloud_answer:
             return jsonify(cloud_answer)
 
+    return jsonify(_offline_answer(query, course_id))
+
+
+def _offline_answer(query: str, course_id: int = None) -> dict:
+    """Answer without the cloud: knowledge base, then local RAG, then a help message."""
     # 2. Offline Fallback: Smart Knowledge Base
+    from knowledge_base import get_smart_answer
     smart_answer = get_smart_answer(query)
     if smart_answer:
-        return jsonify(smart_answer)
+        return smart_answer
     
     # 3. Offline Fallback: Local RAG
-    result = answer_generator.answer(query, course_id)
+    result = _get_answer_generator().answer(query, course_id)
     
     # If RAG has no results, provide helpful response
     if result.get('confidence', 0) < 0.1:
         result = {
-            'answer': f"I don't have specific information about '{query}' in my knowledge base yet. Try asking about topics like:\n\n• Data structures (trees, graphs, sorting)\n• Signals (Fourier, Laplace, filters)\n• Thermodynamics (entropy, Carnot cycle)\n• DSP (FFT, FIR/IIR filters)\n\nYou can also upload PDF or slides for me to learn from!",
-            'citations': [],
-            'confidence': 0.5,
-            'sources': []
+            'answer': FALLBACK_ANSWER.format(query=query),
+            **FALLBACK_RESULT
         }
     
-    return jsonify(result)
+    return result
+
+
+def _sse_event(payload: dict) -> str:
+    """Format one server-sent event carrying a JSON payload."""
+    return f"data: {app.json.dumps(payload)}\n\n"
+
+
+@app.route('/api/query/stream', methods=['POST'])
+@require_auth
+def stream_query():
+    """
+    Answer a question as server-sent events.
+    
+    Cloud answers arrive as {'delta': text} events while they are generated;
+    offline answers come as a single delta. A final {'done': true, ...} event
+    carries citations, confidence and sources. If a cloud answer breaks off
+    after some deltas, the stream ends with an {'error': message} event
+    instead; if it fails before any, the offline answer is sent.
+    """
+    data = request.get_json()
+    
+    query = data.get('query')
+    course_id = data.get('course_id')
+    
+    if not query:
+        return jsonify({'error': 'Query required'}), 400
+    
+    history = data.get('history', [])
+    
+    def events():
+        if os.environ.get('OPENAI_API_KEY'):
+            from rag.cloud_llm import CloudStreamError, stream_openai_answer
+            
+            context = _get_cloud_context(query, course_id)
+            streamed = False
+            try:
+                for fragment in stream_openai_answer(query, context, history):
+                    streamed = True
+                    yield _sse_event({'delta': fragment})
+            except CloudStreamError:
+                if streamed:
+                    # The partial answer cannot be completed or taken back
+                    yield _sse_event({'error': 'The answer was interrupted. Please try again.'})
+                    return
+            else:
+                if streamed:
+                    yield _sse_event({'done': True, 'citations': [], 'confidence': 0.99,
+                                      'sources': ['ChatGPT (Cloud Logic)']})
+                    return
+        
+        result = _offline_answer(query, course_id)
+        yield _sse_event({'delta': result['answer']})
+        yield _sse_event({'done': True, 'citations': result['citations'],
+                          'confidence': result['confidence'], 'sources': result['sources']})
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 # ============ Quiz Endpoints ============
 
+# Question fields that are safe to send to the client, with their defaults
+QUIZ_PUBLIC_FIELDS = {
+    'id': None,
+    'topic_id': None,
+    'topic_name': None,
+    'question_text': None,
+    'question_type': None,
+    'options': (),
+    'difficulty': None
+}
+
+
 @app.route('/api/quiz/<int:course_id>', methods=['GET'])
 @require_auth
 def generate_quiz(course_id):
@@ -344,7 +592,7 @@ def generate_quiz(course_id):
     course_code = course.get('code', 'unknown')
     
     # Get user's mastery levels
-    user_id = request.user['id']
+    user_id = g.user['id']
     progress = get_user_progress(user_id, course_id)
     topic_mastery = {p['topic_id']: p['mastery_level'] for p in progress}
     
@@ -354,6 +602,7 @@ def generate_quiz(course_id):
             topic_mastery[topic['id']] = 0.0
     
     # Generate quiz
+    quiz_generator = _get_quiz_generator()
     if topic_id:
         questions = quiz_generator.generate_topic_quiz(
             course_code, topic_id, num_questions
@@ -373,18 +622,10 @@ def generate_quiz(course_id):
     quiz_id = save_quiz(user_id, course_id, questions)
     
     # Remove correct answers from response
-    quiz_questions = []
-    for q in questions:
-        quiz_q = {
-            'id': q.get('id'),
-            'topic_id': q.get('topic_id'),
-            'topic_name': q.get('topic_name'),
-            'question_text': q.get('question_text'),
-            'question_type': q.get('question_type'),
-            'options': q.get('options', []),
-            'difficulty': q.get('difficulty')
-        }
-        quiz_questions.append(quiz_q)
+    quiz_questions = [
+        {field: q.get(field, default) for field, default in QUIZ_PUBLIC_FIELDS.items()}
+        for q in questions
+    ]
     
     return jsonify({
         'quiz_id': quiz_id,
@@ -405,31 +646,33 @@ def submit_quiz_answers():
     if not quiz_id or not responses:
         return jsonify({'error': 'quiz_id and responses required'}), 400
     
-    user_id = request.user['id']
+    user_id = g.user['id']
     
     # Get quiz questions
-    history = get_quiz_history(user_id)
-    quiz = next((h for h in history if h['id'] == quiz_id), None)
+    quiz = get_quiz_by_id(user_id, quiz_id)
     
     if not quiz:
         return jsonify({'error': 'Quiz not found'}), 404
     
-    questions = json.loads(quiz['questions_json'])
+    questions = app.json.loads(quiz['questions_json'])
     
     # Grade responses
-    grade_result = quiz_generator.grade_quiz(questions, responses)
+    grade_result = _get_quiz_generator().grade_quiz(questions, responses)
     
-    # Update mastery for each topic
-    for result in grade_result['results']:
+    # Update mastery for each topic using BKT, then write all attempts at once
+    bkt = _get_bkt()
+    results = grade_result['results']
+    mastery = get_topic_mastery(user_id, {r['topic_id'] for r in results if r.get('topic_id')})
+    
+    updates = []
+    for result in results:
         topic_id = result.get('topic_id')
         if topic_id:
-            # Get current progress
-            progress = get_or_create_progress(user_id, topic_id)
-            current_mastery = progress['mastery_level']
-            
-            # Update using BKT
-            new_mastery = bkt.update_mastery(current_mastery, result['correct'])
-            update_progress(user_id, topic_id, new_mastery, result['correct'])
+            new_mastery = bkt.update_mastery(mastery.get(topic_id, 0.0), result['correct'])
+            mastery[topic_id] = new_mastery
+            updates.append((topic_id, new_mastery, result['correct']))
+    
+    update_progress_batch(user_id, updates)
     
     # Save quiz submission
     submit_quiz(quiz_id, responses, grade_result['percentage'])
@@ -449,22 +692,23 @@ def submit_quiz_answers():
 @require_auth
 def get_all_progress():
     """Get user's progress across all courses."""
-    user_id = request.user['id']
+    user_id = g.user['id']
     course_id = request.args.get('course_id', type=int)
     
-    progress = get_user_progress(user_id, course_id)
+    progress = get_progress_with_averages(user_id, course_id)
     
-    # Group by course
+    # Group by course; averages are computed by SQL alongside the rows
     by_course = {}
     for p in progress:
         course_name = p.get('course_name', 'Unknown')
-        if course_name not in by_course:
-            by_course[course_name] = {
+        course = by_course.get(course_name)
+        if course is None:
+            course = by_course[course_name] = {
                 'course_id': p.get('course_id'),
                 'topics': [],
-                'average_mastery': 0
+                'average_mastery': round(p['avg_mastery'] * 100, 1)
             }
-        by_course[course_name]['topics'].append({
+        course['topics'].append({
             'topic_id': p['topic_id'],
             'topic_name': p.get('topic_name'),
             'mastery': round(p['mastery_level'] * 100, 1),
@@ -472,12 +716,6 @@ def get_all_progress():
             'correct': p['correct_count']
         })
     
-    # Calculate averages
-    for course in by_course.values():
-        if course['topics']:
-            avg = sum(t['mastery'] for t in course['topics']) / len(course['topics'])
-            course['average_mastery'] = round(avg, 1)
-    
     return jsonify(by_course)
 
 
@@ -485,23 +723,22 @@ def get_all_progress():
 @require_auth
 def get_recommendations(course_id):
     """Get study recommendations based on mastery."""
-    user_id = request.user['id']
-    progress = get_user_progress(user_id, course_id)
+    user_id = g.user['id']
     
-    # Find weak topics
-    weak_topics = [p for p in progress if p['mastery_level'] < 0.6]
-    weak_topics.sort(key=lambda x: x['mastery_level'])
+    # Weakest topics come back filtered, sorted and limited by SQL
+    weak_topics = get_weak_topics(user_id, course_id, threshold=0.6, limit=5)
     
-    recommendations = []
-    for topic in weak_topics[:5]:
-        rec = {
+    bkt = _get_bkt()
+    recommendations = [
+        {
             'topic_id': topic['topic_id'],
             'topic_name': topic.get('topic_name'),
             'current_mastery': round(topic['mastery_level'] * 100, 1),
             'difficulty': bkt.get_difficulty_recommendation(topic['mastery_level']),
             'questions_needed': bkt.estimate_questions_to_mastery(topic['mastery_level'])
         }
-        recommendations.append(rec)
+        for topic in weak_topics
+    ]
     
     return jsonify({
         'recommendations': recommendations,
@@ -523,20 +760,24 @@ def ingest_materials():
     if not file_path:
         return jsonify({'error': 'file_path required'}), 400
     
+    from rag import DocumentIngester
     ingester = DocumentIngester()
     
     path = Path(file_path)
     if path.is_dir():
-        chunks = ingester.ingest_directory(path, course_id)
+        # Streamed file by file into the index
+        chunks = ingester.iter_directory(path, course_id)
     else:
         chunks = ingester.ingest_file(path, course_id)
     
-    if chunks:
-        retriever.add_documents(chunks)
+    chunks_count = _get_retriever().add_documents(chunks)
+    if chunks_count:
+        # Contexts cached before this ingest (including empty ones) are stale
+        _context_cache.clear()
     
     return jsonify({
-        'message': f'Ingested {len(chunks)} chunks',
-        'chunks_count': len(chunks)
+        'message': f'Ingested {chunks_count} chunks',
+        'chunks_count': chunks_count
     })
 
 
@@ -567,41 +808,74 @@ def health_check():
     """Health check endpoint."""
     return jsonify({
         'status': 'healthy',
-        'retriever_size': retriever.size,
-        'courses_available': len(get_all_courses())
+        'retriever_size': _get_retriever().size,
+        'courses_available': len(_cached_courses())
     })
 
 
 # ============ Initialize Demo Data ============
 
 def init_demo_data():
-    """Initialize demo data on startup."""
+    """Initialize demo data on startup (once, before gunicorn forks workers)."""
     # Check if courses already exist
-    courses = get_all_courses()
-    if courses:
+    if get_course_count() > 0:
         return
     
     print("Initializing demo courses...")
     
-    # Load and create courses from JSON files
+    # Load courses from JSON files, then create them in one transaction
+    courses = []
     for course_file in COURSES_PATH.glob("*.json"):
         try:
             with open(course_file, 'r') as f:
                 course_data = json.load(f)
             
-            create_course(
-                name=course_data.get('name', course_file.stem),
-                code=course_data.get('code', course_file.stem),
-                description=course_data.get('description', ''),
-                syllabus=course_data.get('syllabus', {}),
-                topics=course_data.get('topics', [])
-            )
-            print(f"Created course: {course_data.get('name')}")
+            courses.append({
+                'name': course_data.get('name', course_file.stem),
+                'code': course_data.get('code', course_file.stem),
+                'description': course_data.get('description', ''),
+                'syllabus': course_data.get('syllabus', {}),
+                'topics': course_data.get('topics', [])
+            })
         except Exception as e:
             print(f"Error loading {course_file}: {e}")
+    
+    for course, course_id in zip(courses, create_courses(courses)):
+        if course_id:
+            print(f"Created course: {course['name']}")
+    
+    _invalidate_course_cache()
+
+
+@app.cli.command('recompute-mastery')
+def recompute_mastery():
+    """Rebuild all topic mastery levels by replaying submitted quizzes."""
+    quiz_generator = _get_quiz_generator()
+    bkt = _get_bkt()
+    
+    # Correct/incorrect sequence per (user, topic), in submission order
+    sequences = {}
+    for quiz in get_completed_quizzes():
+        questions = app.json.loads(quiz['questions_json'])
+        responses = app.json.loads(quiz['responses_json'])
+        
+        for result in quiz_generator.grade_quiz(questions, responses)['results']:
+            if result.get('topic_id'):
+                key = (quiz['user_id'], result['topic_id'])
+                sequences.setdefault(key, []).append(result['correct'])
+    
+    # One sweep per sequence (JIT-compiled when numba is installed)
+    set_topic_mastery([
+        (user_id, topic_id, bkt.update_from_sequence(responses)[0])
+        for (user_id, topic_id), responses in sequences.items()
+    ])
+    print(f"Recomputed mastery for {len(sequences)} user/topic pairs")
 
 
 if __name__ == '__main__':
+    # Load environment variables for local development
+    load_env_file()
+    
     # Ensure data directories exist
     DATA_PATH.mkdir(parents=True, exist_ok=True)
     COURSES_PATH.mkdir(parents=True, exist_ok=True)
@@ -611,4 +885,5 @@ if __name__ == '__main__':
     
     # Run server
     print("Starting Study Pilot AI Backend...")
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Debug mode (and its reloader) only when explicitly requested
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_DEBUG') == '1')
@@ -0,0 +1,57 @@
+"""
+Study Pilot AI - In-Process Caches
+Small dependency-free TTL cache shared by the API layer
+"""
+
+import threading
+import time
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Bounded mapping whose entries expire after a fixed time-to-live.
+
+    When full, the oldest inserted entry is evicted first.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = {}  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Optional[Any]:
+        """Get a live entry, dropping it if it has expired."""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+
+        if entry[0] <= time.monotonic():
+            with self._lock:
+                self._data.pop(key, None)
+            return default
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        """Store an entry, evicting the oldest one when full."""
+        with self._lock:
+            self._data.pop(key, None)
+            if len(self._data) >= self.maxsize:
+                # Dicts keep insertion order, so the first key is the oldest
+                self._data.pop(next(iter(self._data)), None)
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def pop(self, key: Hashable, default: Any = None) -> Optional[Any]:
+        """Remove an entry and return its value."""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[1] if entry else default
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -3,27 +3,167 @@ Study Pilot AI - SQLite Database Models
 Offline-first storage for users, courses, progress, and quiz history
 """
 
+import os
 import sqlite3
 import hashlib
+import hmac
 import secrets
 import json
-from datetime import datetime
+import threading
+import zlib
+from functools import lru_cache
 from pathlib import Path
 
-DATABASE_PATH = Path(__file__).parent / "data" / "study_pilot.db"
+# Try to import orjson (faster encode/decode of the *_json columns)
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
 
+# Try to import zstandard (better ratio and speed than zlib for stored JSON)
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
 
-def get_connection():
-    """Get database connection with row factory."""
+# Try to import bcrypt
+try:
+    import bcrypt
+    HAS_BCRYPT = True
+except ImportError:
+    HAS_BCRYPT = False
+
+DATABASE_PATH = Path(os.environ.get("DATABASE_PATH") or Path(__file__).parent / "data" / "study_pilot.db")
+
+# Bump when init_database() gains tables or indexes; stored in PRAGMA user_version
+SCHEMA_VERSION = 2
+
+# Password hashing cost (bcrypt log2 rounds); PBKDF2 fallback iterations
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+PBKDF2_ITERATIONS = 600_000
+
+# Entries kept by the per-process cache in front of course lookups
+LOOKUP_CACHE_SIZE = int(os.environ.get('DB_CACHE_SIZE', 2048))
+
+
+if HAS_ORJSON:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS).decode()
+
+    _loads = orjson.loads
+else:
+    _dumps = json.dumps
+    _loads = json.loads
+
+
+# Quiz and plan JSON is stored as a compressed BLOB behind a one-byte codec
+# tag; rows written before compression are plain TEXT and read as-is
+_BLOB_ZLIB = b'\x01'
+_BLOB_ZSTD = b'\x02'
+_QUIZ_BLOB_COLUMNS = ('questions_json', 'responses_json')
+
+
+def _pack_json(obj) -> bytes:
+    """Serialize and compress a value for a *_json BLOB column."""
+    data = _dumps(obj).encode()
+    if HAS_ZSTD:
+        return _BLOB_ZSTD + zstandard.compress(data, 3)
+    return _BLOB_ZLIB + zlib.compress(data)
+
+
+def _unpack_json(value):
+    """Return the JSON text of a *_json column, decompressing if needed."""
+    if not isinstance(value, bytes):
+        return value
+    
+    tag, payload = value[:1], value[1:]
+    if tag == _BLOB_ZSTD:
+        return zstandard.decompress(payload).decode()
+    return zlib.decompress(payload).decode()
+
+
+def _unpack_columns(row: dict, columns: tuple) -> dict:
+    """Replace packed columns of a result dict with their JSON text."""
+    for column in columns:
+        row[column] = _unpack_json(row[column])
+    return row
+
+
+# One connection per thread, reused across calls. SQLite connections must not
+# cross fork(): the gunicorn master closes its own before forking, and workers
+# discard (without closing) any they inherit; see gunicorn.conf.py.
+_tls = threading.local()
+
+# Connections discarded after a fork, kept referenced so they are never
+# garbage-collected (and so closed) in the child
+_inherited_connections = []
+
+
+def _connect() -> sqlite3.Connection:
+    """Open a new connection with tuned pragmas (rows are plain tuples)."""
     DATABASE_PATH.parent.mkdir(parents=True, exist_ok=True)
     conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
+    _init_conn(conn)
+    return conn
+
+
+def _init_conn(conn: sqlite3.Connection):
+    """Apply per-connection settings once, when the connection is opened."""
+    # WAL lets readers proceed during a write; NORMAL is durable enough in WAL mode
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    # Page reads go through the OS page cache instead of per-connection copies
+    conn.execute("PRAGMA mmap_size=268435456")
+
+
+def get_connection():
+    """Get this thread's database connection."""
+    conn = getattr(_tls, 'conn', None)
+    if conn is None:
+        conn = _tls.conn = _connect()
     return conn
 
 
+def close_connection():
+    """Close this thread's connection, if it has one."""
+    conn = getattr(_tls, 'conn', None)
+    if conn is not None:
+        _tls.conn = None
+        conn.close()
+
+
+def discard_connection():
+    """Forget this thread's connection without closing it (use after fork())."""
+    conn = getattr(_tls, 'conn', None)
+    if conn is not None:
+        _tls.conn = None
+        _inherited_connections.append(conn)
+
+
+def _fetch_dict(cursor) -> dict:
+    """Fetch the next row as a dict, or None when there are no more rows."""
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip([col[0] for col in cursor.description], row))
+
+
+def _fetch_dicts(cursor) -> list:
+    """Fetch all remaining rows as dicts, resolving column names once."""
+    keys = [col[0] for col in cursor.description]
+    return [dict(zip(keys, row)) for row in cursor.fetchall()]
+
+
 def init_database():
     """Initialize all database tables."""
-    conn = get_connection()
+    # Short-lived connection so importing this module (e.g. in the gunicorn
+    # master) leaves no pooled connection behind
+    conn = _connect()
     cursor = conn.cursor()
 
     # Users table
@@ -34,10 +174,25 @@ def init_database():
             email TEXT UNIQUE NOT NULL,
             password_hash TEXT NOT NULL,
             api_key TEXT UNIQUE,
+            api_key_hash BLOB,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     """)
 
+    # Databases from before schema v2 lack api_key_hash; add and backfill it
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(users)")}
+    if 'api_key_hash' not in columns:
+        cursor.execute("ALTER TABLE users ADD COLUMN api_key_hash BLOB")
+    cursor.execute("SELECT id, api_key FROM users WHERE api_key_hash IS NULL AND api_key IS NOT NULL")
+    cursor.executemany(
+        "UPDATE users SET api_key_hash = ? WHERE id = ?",
+        [(hash_api_key(api_key), user_id) for user_id, api_key in cursor.fetchall()]
+    )
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_api_key_hash
+        ON users(api_key_hash)
+    """)
+
     # Courses table
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS courses (
@@ -129,23 +284,84 @@ def init_database():
         )
     """)
 
+    # Weak-topic lookups filter and sort on mastery per user
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_progress_user_mastery
+        ON progress(user_id, mastery_level)
+    """)
+
+    # Topic listings and progress joins go through course_id, ordered by week
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_topics_course
+        ON topics(course_id, week_number)
+    """)
+
+    # History and latest-plan lookups are per user/course, newest first
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_quiz_user_course_created
+        ON quiz_history(user_id, course_id, created_at DESC)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_plans_user_course_created
+        ON study_plans(user_id, course_id, created_at DESC)
+    """)
+
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     conn.commit()
+
+    # Refresh planner statistics for tables that changed since the last run
+    conn.execute("PRAGMA optimize")
     conn.close()
 
 
 # ============ User Functions ============
 
 def hash_password(password: str) -> str:
-    """Hash password with salt."""
+    """Hash password with a per-user random salt stored in the hash string."""
+    if HAS_BCRYPT:
+        return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode()
+    
+    salt = secrets.token_hex(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), PBKDF2_ITERATIONS)
+    return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${salt}${digest.hex()}"
+
+
+def _legacy_hash_password(password: str) -> str:
+    """Single-round SHA-256 with a static salt, used by accounts created before bcrypt."""
     salt = "study_pilot_salt_2024"
     return hashlib.sha256(f"{password}{salt}".encode()).hexdigest()
 
 
+def verify_password(password: str, password_hash: str) -> bool:
+    """Check a password against any supported hash format."""
+    if password_hash.startswith('$2'):
+        return HAS_BCRYPT and bcrypt.checkpw(password.encode(), password_hash.encode())
+    
+    if password_hash.startswith('pbkdf2_sha256$'):
+        _, iterations, salt, expected = password_hash.split('$')
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), int(iterations))
+        return hmac.compare_digest(digest.hex(), expected)
+    
+    return hmac.compare_digest(_legacy_hash_password(password), password_hash)
+
+
+def _needs_rehash(password_hash: str) -> bool:
+    """Whether a stored hash should be upgraded to the current scheme."""
+    if HAS_BCRYPT:
+        return not password_hash.startswith('$2')
+    return not password_hash.startswith('pbkdf2_sha256$')
+
+
 def generate_api_key() -> str:
     """Generate a secure API key."""
     return secrets.token_urlsafe(32)
 
 
+def hash_api_key(api_key: str) -> bytes:
+    """Fixed-width digest of an API key, used as its lookup key."""
+    return hashlib.blake2b(api_key.encode(), digest_size=16).digest()
+
+
 def create_user(name: str, email: str, password: str) -> dict:
     """Create a new user and return with API key."""
     conn = get_connection()
@@ -155,110 +371,190 @@ def create_user(name: str, email: str, password: str) -> dict:
     password_hash = hash_password(password)
     
     try:
-        cursor.execute(
-            "INSERT INTO users (name, email, password_hash, api_key) VALUES (?, ?, ?, ?)",
-            (name, email, password_hash, api_key)
-        )
-        conn.commit()
-        user_id = cursor.lastrowid
-        return {"id": user_id, "name": name, "email": email, "api_key": api_key}
+        with conn:
+            cursor.execute(
+                "INSERT INTO users (name, email, password_hash, api_key, api_key_hash) VALUES (?, ?, ?, ?, ?)",
+                (name, email, password_hash, api_key, hash_api_key(api_key))
+            )
     except sqlite3.IntegrityError:
         return None
-    finally:
-        conn.close()
+    
+    return {"id": cursor.lastrowid, "name": name, "email": email, "api_key": api_key}
 
 
 def authenticate_user(email: str, password: str) -> dict:
-    """Authenticate user and return user data with API key."""
+    """
+    Authenticate user and return user data with API key.
+    
+    Hashes from older schemes are upgraded on successful login.
+    """
     conn = get_connection()
     cursor = conn.cursor()
     
-    password_hash = hash_password(password)
     cursor.execute(
-        "SELECT id, name, email, api_key FROM users WHERE email = ? AND password_hash = ?",
-        (email, password_hash)
+        "SELECT id, name, email, api_key, password_hash FROM users WHERE email = ?",
+        (email,)
     )
-    row = cursor.fetchone()
-    conn.close()
+    user = _fetch_dict(cursor)
     
-    if row:
-        return dict(row)
-    return None
+    if not user or not verify_password(password, user['password_hash']):
+        return None
+    
+    if _needs_rehash(user['password_hash']):
+        with conn:
+            cursor.execute(
+                "UPDATE users SET password_hash = ? WHERE id = ?",
+                (hash_password(password), user['id'])
+            )
+    
+    del user['password_hash']
+    return user
 
 
 def get_user_by_api_key(api_key: str) -> dict:
-    """Get user by API key for authentication."""
+    """
+    Get user by API key for authentication.
+    
+    Uncached here; the API layer keeps found users in a short-lived TTL cache.
+    """
     conn = get_connection()
     cursor = conn.cursor()
     
-    cursor.execute("SELECT id, name, email FROM users WHERE api_key = ?", (api_key,))
-    row = cursor.fetchone()
-    conn.close()
+    cursor.execute(
+        "SELECT id, name, email FROM users WHERE api_key_hash = ?",
+        (hash_api_key(api_key),)
+    )
     
-    if row:
-        return dict(row)
-    return None
+    return _fetch_dict(cursor)
 
 
 # ============ Course Functions ============
 
+def _insert_topics(cursor, course_id: int, topics: list):
+    """Insert a course's topics using an open cursor."""
+    cursor.executemany(
+        "INSERT INTO topics (course_id, name, description, week_number, difficulty, prerequisites_json) VALUES (?, ?, ?, ?, ?, ?)",
+        [(course_id, topic['name'], topic.get('description', ''),
+          topic.get('week', i+1), topic.get('difficulty', 0.5),
+          _dumps(topic.get('prerequisites', [])))
+         for i, topic in enumerate(topics)]
+    )
+
+
 def create_course(name: str, code: str, description: str, syllabus: dict, topics: list) -> int:
-    """Create a new course."""
+    """Create a new course and its topics in one transaction."""
     conn = get_connection()
     cursor = conn.cursor()
     
-    cursor.execute(
-        "INSERT INTO courses (name, code, description, syllabus_json, topics_json) VALUES (?, ?, ?, ?, ?)",
-        (name, code, description, json.dumps(syllabus), json.dumps(topics))
-    )
-    conn.commit()
-    course_id = cursor.lastrowid
-    
-    # Create topics
-    for i, topic in enumerate(topics):
+    with conn:
         cursor.execute(
-            "INSERT INTO topics (course_id, name, description, week_number, difficulty, prerequisites_json) VALUES (?, ?, ?, ?, ?, ?)",
-            (course_id, topic['name'], topic.get('description', ''), 
-             topic.get('week', i+1), topic.get('difficulty', 0.5),
-             json.dumps(topic.get('prerequisites', [])))
+            "INSERT INTO courses (name, code, description, syllabus_json, topics_json) VALUES (?, ?, ?, ?, ?)",
+            (name, code, description, _dumps(syllabus), _dumps(topics))
         )
+        course_id = cursor.lastrowid
+        
+        # Create topics
+        _insert_topics(cursor, course_id, topics)
     
-    conn.commit()
-    conn.close()
+    clear_course_cache()
     return course_id
 
 
+def create_courses(courses: list) -> list:
+    """
+    Create several courses in a single transaction.
+    
+    Args:
+        courses: List of dicts with 'name', 'code', 'description', 'syllabus', 'topics'
+        
+    Returns:
+        New course IDs in input order (None where the code already existed)
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    course_ids = []
+    
+    with conn:
+        for course in courses:
+            topics = course.get('topics', [])
+            cursor.execute(
+                "INSERT OR IGNORE INTO courses (name, code, description, syllabus_json, topics_json) VALUES (?, ?, ?, ?, ?)",
+                (course['name'], course['code'], course.get('description', ''),
+                 _dumps(course.get('syllabus', {})), _dumps(topics))
+            )
+            
+            if cursor.rowcount == 0:
+                course_ids.append(None)
+                continue
+            
+            course_id = cursor.lastrowid
+            _insert_topics(cursor, course_id, topics)
+            course_ids.append(course_id)
+    
+    clear_course_cache()
+    return course_ids
+
+
+def get_course_count() -> int:
+    """Get the number of courses."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT COUNT(*) FROM courses")
+    count = cursor.fetchone()[0]
+    
+    return count
+
+
 def get_all_courses() -> list:
     """Get all available courses."""
     conn = get_connection()
     cursor = conn.cursor()
     
     cursor.execute("SELECT id, name, code, description FROM courses")
-    rows = cursor.fetchall()
-    conn.close()
-    
-    return [dict(row) for row in rows]
+    return _fetch_dicts(cursor)
 
 
-def get_course(course_id: int) -> dict:
-    """Get course by ID with topics."""
+class _NotFound(Exception):
+    """Raised inside cached lookups so misses are never cached."""
+
+
+@lru_cache(maxsize=LOOKUP_CACHE_SIZE)
+def _get_course_db(course_id: int) -> dict:
     conn = get_connection()
     cursor = conn.cursor()
     
     cursor.execute("SELECT * FROM courses WHERE id = ?", (course_id,))
-    course = cursor.fetchone()
+    course = _fetch_dict(cursor)
     
     if not course:
-        conn.close()
-        return None
+        raise _NotFound(course_id)
     
     cursor.execute("SELECT * FROM topics WHERE course_id = ? ORDER BY week_number", (course_id,))
-    topics = cursor.fetchall()
-    conn.close()
+    course['topics'] = _fetch_dicts(cursor)
+    return course
+
+
+def get_course(course_id: int) -> dict:
+    """Get course by ID with topics (found courses are cached per process)."""
+    try:
+        course = _get_course_db(course_id)
+    except _NotFound:
+        return None
+    
+    # Callers annotate the result, so hand out copies of the cached entry
+    return {**course, 'topics': [dict(t) for t in course['topics']]}
+
+
+def clear_course_cache():
+    """
+    Drop the courses cached by get_course in this process.
     
-    result = dict(course)
-    result['topics'] = [dict(t) for t in topics]
-    return result
+    The cache is an lru_cache per worker process, and nothing invalidates
+    it across processes. That is safe only because courses and topics are
+    never updated or deleted, and missing IDs are not cached.
+    """
+    _get_course_db.cache_clear()
 
 
 # ============ Progress Functions ============
@@ -268,62 +564,107 @@ def get_or_create_progress(user_id: int, topic_id: int) -> dict:
     conn = get_connection()
     cursor = conn.cursor()
     
-    cursor.execute(
-        "SELECT * FROM progress WHERE user_id = ? AND topic_id = ?",
-        (user_id, topic_id)
-    )
-    row = cursor.fetchone()
-    
-    if not row:
-        cursor.execute(
-            "INSERT INTO progress (user_id, topic_id) VALUES (?, ?)",
-            (user_id, topic_id)
-        )
-        conn.commit()
+    # No-op update on conflict so RETURNING yields the existing row too
+    with conn:
         cursor.execute(
-            "SELECT * FROM progress WHERE user_id = ? AND topic_id = ?",
+            """INSERT INTO progress (user_id, topic_id) VALUES (?, ?)
+               ON CONFLICT(user_id, topic_id) DO UPDATE SET topic_id = topic_id
+               RETURNING *""",
             (user_id, topic_id)
         )
-        row = cursor.fetchone()
+        row = _fetch_dict(cursor)
     
-    conn.close()
-    return dict(row)
+    return row
 
 
 def update_progress(user_id: int, topic_id: int, mastery_level: float, 
                     correct: bool, p_learn: float = None) -> dict:
-    """Update progress after quiz attempt."""
+    """Update progress after quiz attempt, creating the record if needed."""
     conn = get_connection()
     cursor = conn.cursor()
     
-    # Get current progress
-    progress = get_or_create_progress(user_id, topic_id)
-    
-    new_attempts = progress['attempts'] + 1
-    new_correct = progress['correct_count'] + (1 if correct else 0)
-    
-    update_fields = [
-        "mastery_level = ?",
-        "attempts = ?",
-        "correct_count = ?",
-        "last_updated = ?"
-    ]
-    params = [mastery_level, new_attempts, new_correct, datetime.now()]
+    # 0.3 mirrors the p_learn column default for newly created records
+    with conn:
+        cursor.execute(
+            """INSERT INTO progress (user_id, topic_id, mastery_level, attempts,
+                                     correct_count, last_updated, p_learn)
+               VALUES (:user_id, :topic_id, :mastery, 1, :correct, CURRENT_TIMESTAMP, COALESCE(:p_learn, 0.3))
+               ON CONFLICT(user_id, topic_id) DO UPDATE SET
+                   mastery_level = :mastery,
+                   attempts = attempts + 1,
+                   correct_count = correct_count + :correct,
+                   last_updated = CURRENT_TIMESTAMP,
+                   p_learn = COALESCE(:p_learn, p_learn)
+               RETURNING *""",
+            {'user_id': user_id, 'topic_id': topic_id, 'mastery': mastery_level,
+             'correct': 1 if correct else 0, 'p_learn': p_learn}
+        )
+        row = _fetch_dict(cursor)
     
-    if p_learn is not None:
-        update_fields.append("p_learn = ?")
-        params.append(p_learn)
+    return row
+
+
+def get_topic_mastery(user_id: int, topic_ids: list) -> dict:
+    """Get current mastery for a set of topics as {topic_id: mastery_level}."""
+    topic_ids = list(topic_ids)
+    if not topic_ids:
+        return {}
     
-    params.extend([user_id, topic_id])
+    conn = get_connection()
+    cursor = conn.cursor()
     
+    placeholders = ', '.join('?' * len(topic_ids))
     cursor.execute(
-        f"UPDATE progress SET {', '.join(update_fields)} WHERE user_id = ? AND topic_id = ?",
-        params
+        f"SELECT topic_id, mastery_level FROM progress WHERE user_id = ? AND topic_id IN ({placeholders})",
+        [user_id, *topic_ids]
     )
-    conn.commit()
-    conn.close()
+    return dict(cursor.fetchall())
+
+
+def update_progress_batch(user_id: int, updates: list):
+    """
+    Apply several quiz attempts in one transaction.
+    
+    Args:
+        user_id: User the attempts belong to
+        updates: List of (topic_id, mastery_level, correct) tuples, applied in order
+    """
+    if not updates:
+        return
+    
+    conn = get_connection()
+    
+    with conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO progress (user_id, topic_id) VALUES (?, ?)",
+            [(user_id, topic_id) for topic_id in {u[0] for u in updates}]
+        )
+        conn.executemany(
+            """UPDATE progress
+               SET mastery_level = ?, attempts = attempts + 1,
+                   correct_count = correct_count + ?, last_updated = CURRENT_TIMESTAMP
+               WHERE user_id = ? AND topic_id = ?""",
+            [(mastery_level, 1 if correct else 0, user_id, topic_id)
+             for topic_id, mastery_level, correct in updates]
+        )
+
+
+def set_topic_mastery(updates: list):
+    """
+    Overwrite mastery levels in one transaction, creating records as needed.
     
-    return get_or_create_progress(user_id, topic_id)
+    Args:
+        updates: List of (user_id, topic_id, mastery_level) tuples
+    """
+    conn = get_connection()
+    
+    with conn:
+        conn.executemany(
+            """INSERT INTO progress (user_id, topic_id, mastery_level) VALUES (?, ?, ?)
+               ON CONFLICT(user_id, topic_id) DO UPDATE SET
+                   mastery_level = excluded.mastery_level""",
+            updates
+        )
 
 
 def get_user_progress(user_id: int, course_id: int = None) -> list:
@@ -350,10 +691,74 @@ def get_user_progress(user_id: int, course_id: int = None) -> list:
             ORDER BY c.name, t.week_number
         """, (user_id,))
     
-    rows = cursor.fetchall()
-    conn.close()
+    return _fetch_dicts(cursor)
+
+
+def get_progress_with_averages(user_id: int, course_id: int = None) -> list:
+    """
+    Get a user's progress records, each carrying its course's average mastery.
+    
+    Same rows as get_user_progress, plus an 'avg_mastery' column computed by
+    SQLite in the same scan.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    query = """
+        SELECT p.*, t.name as topic_name, t.course_id, c.name as course_name,
+               AVG(p.mastery_level) OVER (PARTITION BY t.course_id) as avg_mastery
+        FROM progress p
+        JOIN topics t ON p.topic_id = t.id
+        JOIN courses c ON t.course_id = c.id
+        WHERE p.user_id = ?
+    """
+    params = [user_id]
     
-    return [dict(row) for row in rows]
+    if course_id:
+        query += " AND t.course_id = ?"
+        params.append(course_id)
+    
+    cursor.execute(query + " ORDER BY c.name, t.week_number", params)
+    return _fetch_dicts(cursor)
+
+
+def get_progress_summary_by_user(user_id: int, course_id: int = None) -> dict:
+    """Get average mastery per course for a user as {course_id: avg_mastery}."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    query = """
+        SELECT t.course_id, AVG(p.mastery_level) as avg_mastery
+        FROM progress p
+        JOIN topics t ON p.topic_id = t.id
+        WHERE p.user_id = ?
+    """
+    params = [user_id]
+    
+    if course_id:
+        query += " AND t.course_id = ?"
+        params.append(course_id)
+    
+    cursor.execute(query + " GROUP BY t.course_id", params)
+    return dict(cursor.fetchall())
+
+
+def get_weak_topics(user_id: int, course_id: int, threshold: float = 0.6,
+                    limit: int = 5) -> list:
+    """Get a user's weakest topics in a course, lowest mastery first."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("""
+        SELECT p.*, t.name as topic_name, t.course_id
+        FROM progress p
+        JOIN topics t ON p.topic_id = t.id
+        WHERE p.user_id = ? AND t.course_id = ? AND p.mastery_level < ?
+        ORDER BY p.mastery_level, t.week_number
+        LIMIT ?
+    """, (user_id, course_id, threshold, limit))
+    
+    return _fetch_dicts(cursor)
 
 
 # ============ Quiz History Functions ============
@@ -363,15 +768,13 @@ def save_quiz(user_id: int, course_id: int, questions: list) -> int:
     conn = get_connection()
     cursor = conn.cursor()
     
-    cursor.execute(
-        "INSERT INTO quiz_history (user_id, course_id, questions_json) VALUES (?, ?, ?)",
-        (user_id, course_id, json.dumps(questions))
-    )
-    conn.commit()
-    quiz_id = cursor.lastrowid
-    conn.close()
+    with conn:
+        cursor.execute(
+            "INSERT INTO quiz_history (user_id, course_id, questions_json) VALUES (?, ?, ?)",
+            (user_id, course_id, _pack_json(questions))
+        )
     
-    return quiz_id
+    return cursor.lastrowid
 
 
 def submit_quiz(quiz_id: int, responses: list, score: float) -> dict:
@@ -379,17 +782,30 @@ def submit_quiz(quiz_id: int, responses: list, score: float) -> dict:
     conn = get_connection()
     cursor = conn.cursor()
     
-    cursor.execute(
-        "UPDATE quiz_history SET responses_json = ?, score = ?, completed_at = ? WHERE id = ?",
-        (json.dumps(responses), score, datetime.now(), quiz_id)
-    )
-    conn.commit()
+    with conn:
+        cursor.execute(
+            "UPDATE quiz_history SET responses_json = ?, score = ?, completed_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (_pack_json(responses), score, quiz_id)
+        )
     
     cursor.execute("SELECT * FROM quiz_history WHERE id = ?", (quiz_id,))
-    row = cursor.fetchone()
-    conn.close()
+    row = _fetch_dict(cursor)
     
-    return dict(row) if row else None
+    return _unpack_columns(row, _QUIZ_BLOB_COLUMNS) if row else None
+
+
+def get_quiz_by_id(user_id: int, quiz_id: int) -> dict:
+    """Get a single quiz belonging to a user."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute(
+        "SELECT * FROM quiz_history WHERE id = ? AND user_id = ? LIMIT 1",
+        (quiz_id, user_id)
+    )
+    row = _fetch_dict(cursor)
+    
+    return _unpack_columns(row, _QUIZ_BLOB_COLUMNS) if row else None
 
 
 def get_quiz_history(user_id: int, course_id: int = None) -> list:
@@ -408,10 +824,22 @@ def get_quiz_history(user_id: int, course_id: int = None) -> list:
             (user_id,)
         )
     
-    rows = cursor.fetchall()
-    conn.close()
+    return [_unpack_columns(row, _QUIZ_BLOB_COLUMNS) for row in _fetch_dicts(cursor)]
+
+
+def get_completed_quizzes() -> list:
+    """Get every submitted quiz (all users), oldest submission first."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("""
+        SELECT id, user_id, questions_json, responses_json
+        FROM quiz_history
+        WHERE completed_at IS NOT NULL
+        ORDER BY completed_at, id
+    """)
     
-    return [dict(row) for row in rows]
+    return [_unpack_columns(row, _QUIZ_BLOB_COLUMNS) for row in _fetch_dicts(cursor)]
 
 
 # ============ Study Plan Functions ============
@@ -422,15 +850,13 @@ def save_study_plan(user_id: int, course_id: int, plan: dict,
     conn = get_connection()
     cursor = conn.cursor()
     
-    cursor.execute(
-        "INSERT INTO study_plans (user_id, course_id, plan_json, goal_date, hours_per_week) VALUES (?, ?, ?, ?, ?)",
-        (user_id, course_id, json.dumps(plan), goal_date, hours_per_week)
-    )
-    conn.commit()
-    plan_id = cursor.lastrowid
-    conn.close()
+    with conn:
+        cursor.execute(
+            "INSERT INTO study_plans (user_id, course_id, plan_json, goal_date, hours_per_week) VALUES (?, ?, ?, ?, ?)",
+            (user_id, course_id, _pack_json(plan), goal_date, hours_per_week)
+        )
     
-    return plan_id
+    return cursor.lastrowid
 
 
 def get_latest_study_plan(user_id: int, course_id: int) -> dict:
@@ -442,15 +868,37 @@ def get_latest_study_plan(user_id: int, course_id: int) -> dict:
         "SELECT * FROM study_plans WHERE user_id = ? AND course_id = ? ORDER BY created_at DESC LIMIT 1",
         (user_id, course_id)
     )
-    row = cursor.fetchone()
-    conn.close()
+    row = _fetch_dict(cursor)
     
     if row:
-        result = dict(row)
-        result['plan'] = json.loads(result['plan_json'])
+        result = _unpack_columns(row, ('plan_json',))
+        result['plan'] = _loads(result['plan_json'])
         return result
     return None
 
 
+def ensure_database():
+    """Create or migrate the schema only if the file is missing or out of date."""
+    if DATABASE_PATH.exists():
+        conn = sqlite3.connect(DATABASE_PATH)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        conn.close()
+        if version >= SCHEMA_VERSION:
+            return
+    
+    init_database()
+
+
 # Initialize database on import
-init_database()
+ensure_database()
+
+
+if __name__ == '__main__':
+    # Explicit schema setup for deploy scripts: python backend/database.py init
+    import sys
+    
+    if sys.argv[1:] == ['init']:
+        init_database()
+        print(f"Database initialized at {DATABASE_PATH} (schema v{SCHEMA_VERSION})")
+    else:
+        print("Usage: python backend/database.py init")
@@ -5,10 +5,25 @@ Lightweight implementation for mastery tracking
 
 import math
 from dataclasses import dataclass
+from functools import lru_cache
+from itertools import chain, islice
 from typing import List, Tuple
 
+import numpy as np
 
-@dataclass
+# Try to import numba (optional JIT for replaying long response histories)
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+
+# Question difficulty levels in increasing order
+DIFFICULTY_ORDER = {"easy": 0, "medium": 1, "hard": 2, "challenge": 3}
+
+
+@dataclass(slots=True, frozen=True)
 class BKTParams:
     """Parameters for Bayesian Knowledge Tracing."""
     p_init: float = 0.0      # Initial probability of mastery (P(L0))
@@ -17,6 +32,62 @@ class BKTParams:
     p_slip: float = 0.1      # Probability of incorrect answer when mastered (P(S))
 
 
+def _replay_responses(responses, p_mastery, p_guess, p_slip, p_learn, history):
+    """
+    Apply BKT updates over a response sequence, writing P(L_n) into history.
+    
+    Scalar kernel shared by the pure-Python and numba paths; history must
+    hold len(responses) + 1 slots and history[0] is the starting mastery.
+    """
+    history[0] = p_mastery
+    for i in range(len(responses)):
+        if responses[i]:
+            numerator = (1 - p_slip) * p_mastery
+            denominator = numerator + p_guess * (1 - p_mastery)
+        else:
+            numerator = p_slip * p_mastery
+            denominator = numerator + (1 - p_guess) * (1 - p_mastery)
+        
+        if denominator > 0:
+            p_mastery = numerator / denominator
+        p_mastery = p_mastery + (1 - p_mastery) * p_learn
+        p_mastery = max(0.0, min(1.0, p_mastery))
+        history[i + 1] = p_mastery
+    return p_mastery
+
+
+if HAS_NUMBA:
+    _replay_responses_jit = njit(cache=True)(_replay_responses)
+
+
+@lru_cache(maxsize=4096)
+def _questions_to_mastery(mastery_pct: int, target_mastery: float,
+                          assumed_accuracy: float, likelihoods: tuple) -> int:
+    """Simulate expected BKT updates from a mastery level quantized to whole percents."""
+    (p_c_m, p_c_nm), (p_i_m, p_i_nm), p_learn = likelihoods
+    
+    p = mastery_pct / 100
+    questions = 0
+    max_questions = 100  # Safety limit
+    
+    while p < target_mastery and questions < max_questions:
+        # Expected update, weighted by accuracy, over both possible responses
+        num = p_c_m * p
+        den = num + p_c_nm * (1 - p)
+        p_if_correct = num / den if den > 0 else p
+        p_if_correct = min(1.0, p_if_correct + (1 - p_if_correct) * p_learn)
+        
+        num = p_i_m * p
+        den = num + p_i_nm * (1 - p)
+        p_if_incorrect = num / den if den > 0 else p
+        p_if_incorrect = min(1.0, p_if_incorrect + (1 - p_if_incorrect) * p_learn)
+        
+        p = assumed_accuracy * p_if_correct + (1 - assumed_accuracy) * p_if_incorrect
+        questions += 1
+    
+    return questions
+
+
 class BayesianKnowledgeTracer:
     """
     Bayesian Knowledge Tracing implementation.
@@ -30,6 +101,11 @@ class BayesianKnowledgeTracer:
     
     def __init__(self, params: BKTParams = None):
         self.params = params or BKTParams()
+        
+        # Observation likelihoods: P(obs | mastered), P(obs | not mastered)
+        self._p_correct = (1 - self.params.p_slip, self.params.p_guess)
+        self._p_incorrect = (self.params.p_slip, 1 - self.params.p_guess)
+        self._p_learn = self.params.p_learn
     
     def update_mastery(self, p_mastery: float, correct: bool) -> float:
         """
@@ -48,46 +124,15 @@ class BayesianKnowledgeTracer:
         Returns:
             Updated probability of mastery P(L_{n+1})
         """
-        p_g = self.params.p_guess
-        p_s = self.params.p_slip
-        p_t = self.params.p_learn
-        
-        if correct:
-            # P(correct | mastered) = 1 - P(slip)
-            # P(correct | not mastered) = P(guess)
-            p_correct_given_mastered = 1 - p_s
-            p_correct_given_not_mastered = p_g
-            
-            # Bayes update
-            numerator = p_correct_given_mastered * p_mastery
-            denominator = numerator + p_correct_given_not_mastered * (1 - p_mastery)
-            
-            if denominator > 0:
-                p_mastery_given_correct = numerator / denominator
-            else:
-                p_mastery_given_correct = p_mastery
-        else:
-            # P(incorrect | mastered) = P(slip)
-            # P(incorrect | not mastered) = 1 - P(guess)
-            p_incorrect_given_mastered = p_s
-            p_incorrect_given_not_mastered = 1 - p_g
-            
-            # Bayes update
-            numerator = p_incorrect_given_mastered * p_mastery
-            denominator = numerator + p_incorrect_given_not_mastered * (1 - p_mastery)
-            
-            if denominator > 0:
-                p_mastery_given_incorrect = numerator / denominator
-            else:
-                p_mastery_given_incorrect = p_mastery
-            
-            p_mastery_given_correct = p_mastery_given_incorrect  # Using same variable for simplicity
+        p_obs_mastered, p_obs_not_mastered = self._p_correct if correct else self._p_incorrect
         
-        # Apply learning transition
-        p_mastery_after_obs = p_mastery_given_correct if correct else numerator / denominator if denominator > 0 else p_mastery
+        # Bayes update
+        numerator = p_obs_mastered * p_mastery
+        denominator = numerator + p_obs_not_mastered * (1 - p_mastery)
+        p_posterior = numerator / denominator if denominator > 0 else p_mastery
         
         # Learning transition: even if not mastered, might learn
-        p_new_mastery = p_mastery_after_obs + (1 - p_mastery_after_obs) * p_t
+        p_new_mastery = p_posterior + (1 - p_posterior) * self._p_learn
         
         # Clamp to valid probability range
         return max(0.0, min(1.0, p_new_mastery))
@@ -105,12 +150,17 @@ class BayesianKnowledgeTracer:
             Tuple of (final_mastery, history_of_mastery_values)
         """
         p_mastery = p_init if p_init is not None else self.params.p_init
-        history = [p_mastery]
+        params = (self.params.p_guess, self.params.p_slip, self.params.p_learn)
         
-        for correct in responses:
-            p_mastery = self.update_mastery(p_mastery, correct)
-            history.append(p_mastery)
+        if HAS_NUMBA:
+            history = np.empty(len(responses) + 1)
+            p_mastery = _replay_responses_jit(
+                np.asarray(responses, dtype=np.bool_), float(p_mastery), *params, history
+            )
+            return p_mastery, history.tolist()
         
+        history = [0.0] * (len(responses) + 1)
+        p_mastery = _replay_responses(responses, p_mastery, *params, history)
         return p_mastery, history
     
     def estimate_questions_to_mastery(self, current_mastery: float, 
@@ -125,23 +175,16 @@ class BayesianKnowledgeTracer:
             assumed_accuracy: Assumed probability of answering correctly
             
         Returns:
-            Estimated number of questions
+            Estimated number of questions (current mastery is rounded down to 0.01)
         """
         if current_mastery >= target_mastery:
             return 0
         
-        p = current_mastery
-        questions = 0
-        max_questions = 100  # Safety limit
-        
-        while p < target_mastery and questions < max_questions:
-            # Simulate expected update (weighted by accuracy)
-            p_if_correct = self.update_mastery(p, True)
-            p_if_incorrect = self.update_mastery(p, False)
-            p = assumed_accuracy * p_if_correct + (1 - assumed_accuracy) * p_if_incorrect
-            questions += 1
-        
-        return questions
+        # Nearby mastery values share a cached result (0.01 buckets)
+        return _questions_to_mastery(
+            int(current_mastery * 100), target_mastery, assumed_accuracy,
+            (self._p_correct, self._p_incorrect, self._p_learn)
+        )
     
     def get_difficulty_recommendation(self, mastery: float) -> str:
         """
@@ -232,41 +275,30 @@ class AdaptiveQuizSelector:
             priority = self.bkt.calculate_topic_priority(mastery)
             topic_priorities[topic_id] = priority
         
-        # Group questions by topic
-        by_topic = {}
+        # Target difficulty per topic, from its mastery
+        target_diff = {
+            topic_id: DIFFICULTY_ORDER.get(self.bkt.get_difficulty_recommendation(mastery), 1)
+            for topic_id, mastery in topic_mastery.items()
+        }
+        
+        # Single pass: bucket each question by topic and by distance from the
+        # target difficulty (0-3), which keeps pool order within a bucket and
+        # replaces a sort per topic
+        buckets = {topic_id: ([], [], [], []) for topic_id in target_diff}
         for q in question_pool:
             topic = q.get('topic_id')
-            if topic not in by_topic:
-                by_topic[topic] = []
-            by_topic[topic].append(q)
+            topic_buckets = buckets.get(topic)
+            if topic_buckets is not None:
+                diff = DIFFICULTY_ORDER.get(q.get('difficulty', 'medium'), 1)
+                topic_buckets[abs(diff - target_diff[topic])].append(q)
         
         # Allocate questions to topics based on priority
         total_priority = sum(topic_priorities.values()) or 1
-        topic_allocation = {}
         
+        selected = []
         for topic_id, priority in topic_priorities.items():
             allocation = max(1, int(num_questions * priority / total_priority))
-            topic_allocation[topic_id] = allocation
-        
-        # Select questions from each topic
-        selected = []
-        for topic_id, allocation in topic_allocation.items():
-            if topic_id not in by_topic:
-                continue
-            
-            pool = by_topic[topic_id]
-            mastery = topic_mastery.get(topic_id, 0.5)
-            recommended_diff = self.bkt.get_difficulty_recommendation(mastery)
-            
-            # Sort by difficulty match
-            difficulty_order = {"easy": 0, "medium": 1, "hard": 2, "challenge": 3}
-            target_diff = difficulty_order.get(recommended_diff, 1)
-            
-            pool_sorted = sorted(pool, key=lambda q: 
-                abs(difficulty_order.get(q.get('difficulty', 'medium'), 1) - target_diff))
-            
-            # Take allocated number
-            selected.extend(pool_sorted[:allocation])
+            selected.extend(islice(chain.from_iterable(buckets[topic_id]), allocation))
         
         # Trim to exact number if over
         return selected[:num_questions]
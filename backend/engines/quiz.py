@@ -3,12 +3,92 @@ Study Pilot AI - Quiz Generation Engine
 Adaptive quiz generation based on course content and student mastery
 """
 
+import heapq
 import json
+import math
+import os
 import random
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import chain
 from pathlib import Path
 from typing import List, Dict, Optional
 from dataclasses import dataclass
 
+import numpy as np
+
+# orjson is optional; stdlib json is used without it
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+# Sampling weight multiplier for questions at a topic's target difficulty
+DIFFICULTY_MATCH_BONUS = 4.0
+
+# Banks at least this large are sampled with NumPy instead of a Python loop
+NUMPY_SAMPLING_MIN_QUESTIONS = 1000
+
+DIFFICULTY_CODES = {'easy': 0, 'medium': 1, 'hard': 2}
+
+# Mastery cut points between target difficulties: below the first is easy,
+# below the second medium, otherwise hard (digitize gives DIFFICULTY_CODES)
+MASTERY_DIFFICULTY_CUTS = (0.3, 0.6)
+
+# Threads used to read and parse several changed question banks at once
+BANK_LOAD_WORKERS = 4
+
+# Parsed question banks shared across generators:
+# path -> (mtime_ns, size, course_code, questions, by_topic, by_topic_diff, arrays)
+_BANK_CACHE: Dict[Path, tuple] = {}
+
+
+def _index_questions(questions: List[dict]) -> tuple:
+    """Group a bank by topic_id and by (topic_id, difficulty) in one pass."""
+    by_topic = defaultdict(list)
+    by_topic_diff = defaultdict(list)
+    
+    for q in questions:
+        topic_id = q.get('topic_id')
+        by_topic[topic_id].append(q)
+        by_topic_diff[(topic_id, q.get('difficulty'))].append(q)
+    
+    return dict(by_topic), dict(by_topic_diff)
+
+
+@lru_cache(maxsize=4096)
+def _answer_key(correct_answer: str, options: tuple) -> tuple:
+    """
+    Normalized correct answer plus the MCQ option letters that match it.
+    
+    Cached on the raw values, so banks and quizzes reloaded from the
+    database share entries and grading skips re-normalizing options.
+    """
+    normalized = correct_answer.strip().lower()
+    letters = frozenset(chr(97 + i) for i, opt in enumerate(options)
+                        if opt.strip().lower() == normalized)
+    return normalized, letters
+
+
+def _question_arrays(questions: List[dict], topic_ids: List) -> dict:
+    """
+    Column arrays for vectorized sampling over a bank.
+    
+    'topic' holds each question's position in topic_ids and 'difficulty'
+    its DIFFICULTY_CODES value (-1 if unknown).
+    """
+    topic_index = {topic_id: i for i, topic_id in enumerate(topic_ids)}
+    return {
+        'topic_ids': topic_ids,
+        'topic': np.fromiter((topic_index[q.get('topic_id')] for q in questions),
+                             dtype=np.intp, count=len(questions)),
+        'difficulty': np.fromiter((DIFFICULTY_CODES.get(q.get('difficulty'), -1) for q in questions),
+                                  dtype=np.int8, count=len(questions)),
+    }
+
 
 @dataclass
 class Question:
@@ -25,6 +105,24 @@ class Question:
     source_citation: str  # Reference to course material
 
 
+def _load_bank(course_file: Path, stat: os.stat_result):
+    """Parse and index one course file into _BANK_CACHE (errors are reported, not raised)."""
+    try:
+        with open(course_file, 'rb') as f:
+            raw = f.read()
+        course_data = orjson.loads(raw) if HAS_ORJSON else json.loads(raw)
+        questions = course_data.get('questions', [])
+        by_topic, by_topic_diff = _index_questions(questions)
+        arrays = None
+        if len(questions) >= NUMPY_SAMPLING_MIN_QUESTIONS:
+            arrays = _question_arrays(questions, list(by_topic))
+        _BANK_CACHE[course_file] = (stat.st_mtime_ns, stat.st_size,
+                                    course_data.get('code', course_file.stem),
+                                    questions, by_topic, by_topic_diff, arrays)
+    except Exception as e:
+        print(f"Error loading {course_file}: {e}")
+
+
 class QuizGenerator:
     """
     Generates adaptive quizzes based on course content and student progress.
@@ -33,6 +131,9 @@ class QuizGenerator:
     def __init__(self, courses_path: Path = None):
         self.courses_path = courses_path or Path(__file__).parent.parent / "data" / "courses"
         self.question_banks = {}
+        self.by_topic = {}       # course_code -> {topic_id: [question]}
+        self.by_topic_diff = {}  # course_code -> {(topic_id, difficulty): [question]}
+        self.question_arrays = {}  # course_code -> column arrays (large banks only)
         self._load_question_banks()
     
     def _load_question_banks(self):
@@ -40,26 +141,43 @@ class QuizGenerator:
         if not self.courses_path.exists():
             return
         
-        for course_file in self.courses_path.glob("*.json"):
-            try:
-                with open(course_file, 'r') as f:
-                    course_data = json.load(f)
-                    course_code = course_data.get('code', course_file.stem)
-                    self.question_banks[course_code] = course_data.get('questions', [])
-            except Exception as e:
-                print(f"Error loading {course_file}: {e}")
+        files = []
+        with os.scandir(self.courses_path) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.json') or not entry.is_file():
+                    continue
+                try:
+                    files.append((Path(entry.path), entry.stat()))
+                except OSError as e:
+                    print(f"Error loading {entry.path}: {e}")
+        
+        # Parse new or changed banks, overlapping their reads on a cold start
+        stale = [(path, stat) for path, stat in files
+                 if _BANK_CACHE.get(path, ())[:2] != (stat.st_mtime_ns, stat.st_size)]
+        if len(stale) > 1:
+            with ThreadPoolExecutor(max_workers=min(BANK_LOAD_WORKERS, len(stale))) as pool:
+                list(pool.map(lambda item: _load_bank(*item), stale))
+        elif stale:
+            _load_bank(*stale[0])
+        
+        for course_file, _ in files:
+            cached = _BANK_CACHE.get(course_file)
+            if cached is None:
+                continue
+            course_code = cached[2]
+            self.question_banks[course_code] = cached[3]
+            self.by_topic[course_code] = cached[4]
+            self.by_topic_diff[course_code] = cached[5]
+            self.question_arrays[course_code] = cached[6]
     
     def get_questions_for_topic(self, course_code: str, topic_id: int, 
                                  difficulty: str = None) -> List[dict]:
-        """Get questions for a specific topic."""
-        questions = self.question_banks.get(course_code, [])
-        
-        filtered = [q for q in questions if q.get('topic_id') == topic_id]
-        
+        """Get questions for a specific topic (a new list the caller may reorder)."""
         if difficulty:
-            filtered = [q for q in filtered if q.get('difficulty') == difficulty]
+            index = self.by_topic_diff.get(course_code, {})
+            return list(index.get((topic_id, difficulty), ()))
         
-        return filtered
+        return list(self.by_topic.get(course_code, {}).get(topic_id, ()))
     
     def generate_adaptive_quiz(self, course_code: str, 
                                 topic_mastery: Dict[int, float],
@@ -92,81 +210,113 @@ class QuizGenerator:
                 weight = 1.0
             topic_weights[topic_id] = weight
         
-        # Normalize weights
-        total_weight = sum(topic_weights.values()) or 1
-        topic_weights = {k: v / total_weight for k, v in topic_weights.items()}
+        arrays = self.question_arrays.get(course_code)
+        if arrays is not None:
+            return self._sample_vectorized(all_questions, arrays, topic_mastery,
+                                           topic_weights, num_questions)
+        
+        # Per-question sampling weights: each topic's weight is shared among its
+        # questions, with matching-difficulty questions counting extra
+        by_topic = self.by_topic[course_code]
+        candidates = []
+        weights = []
+        for topic_id, topic_weight in topic_weights.items():
+            topic_questions = by_topic.get(topic_id)
+            if not topic_questions:
+                continue
+            
+            target_diff = self._target_difficulty(topic_mastery.get(topic_id, 0.5))
+            bonuses = [DIFFICULTY_MATCH_BONUS if q.get('difficulty') == target_diff else 1.0
+                       for q in topic_questions]
+            scale = topic_weight / sum(bonuses)
+            candidates.extend(topic_questions)
+            weights.extend(bonus * scale for bonus in bonuses)
+        
+        # Weighted sample without replacement (Efraimidis-Spirakis A-ES): keep
+        # the num_questions largest log(u) / w keys; 1 - random() avoids log(0)
+        keys = [math.log(1.0 - random.random()) / w for w in weights]
+        top = heapq.nlargest(num_questions, range(len(candidates)), key=keys.__getitem__)
+        
+        selected = [candidates[i] for i in top]
+        random.shuffle(selected)
+        return selected
+    
+    def _sample_vectorized(self, questions: List[dict], arrays: dict,
+                           topic_mastery: Dict[int, float],
+                           topic_weights: Dict[int, float],
+                           num_questions: int) -> List[dict]:
+        """
+        NumPy version of the A-ES sample in generate_adaptive_quiz.
         
-        # Calculate questions per topic
-        questions_per_topic = {}
-        for topic_id, weight in topic_weights.items():
-            allocation = max(1, round(num_questions * weight))
-            questions_per_topic[topic_id] = allocation
+        Uses the exponential form of the keys: the largest log(u) / w are the
+        smallest E / w with E ~ Exp(1).
+        """
+        topic_ids = arrays['topic_ids']
+        topic_weight = np.array([topic_weights.get(t, 0.0) for t in topic_ids])
+        mastery = np.array([topic_mastery.get(t, 0.5) for t in topic_ids])
+        target_code = np.digitize(mastery, MASTERY_DIFFICULTY_CUTS).astype(np.int8)
+        
+        # Same weighting as the Python path: topic weight split over its
+        # questions, matching difficulty counting DIFFICULTY_MATCH_BONUS times
+        topic = arrays['topic']
+        bonus = np.where(arrays['difficulty'] == target_code[topic], DIFFICULTY_MATCH_BONUS, 1.0)
+        bonus_per_topic = np.bincount(topic, weights=bonus, minlength=len(topic_ids))
+        weights = topic_weight[topic] * bonus / bonus_per_topic[topic]
+        
+        eligible = np.flatnonzero(weights > 0)
+        k = min(num_questions, len(eligible))
+        if k == 0:
+            return []
         
-        # Select questions with appropriate difficulty
-        selected = []
-        for topic_id, count in questions_per_topic.items():
-            mastery = topic_mastery.get(topic_id, 0.5)
-            
-            # Determine target difficulty based on mastery
-            if mastery < 0.3:
-                target_diff = 'easy'
-            elif mastery < 0.6:
-                target_diff = 'medium'
-            else:
-                target_diff = 'hard'
-            
-            # Get questions for this topic
-            topic_questions = [q for q in all_questions 
-                              if q.get('topic_id') == topic_id]
-            
-            # Prioritize matching difficulty
-            matching = [q for q in topic_questions if q.get('difficulty') == target_diff]
-            others = [q for q in topic_questions if q.get('difficulty') != target_diff]
-            
-            # Shuffle and select
-            random.shuffle(matching)
-            random.shuffle(others)
-            
-            pool = matching + others
-            selected.extend(pool[:count])
+        # Drawn from the random module so random.seed() fixes both sampling paths
+        rng = np.random.default_rng(random.getrandbits(64))
+        keys = rng.standard_exponential(len(eligible)) / weights[eligible]
+        top = eligible[np.argpartition(keys, k - 1)[:k]]
         
-        # Shuffle final selection and trim to exact count
+        selected = [questions[i] for i in top]
         random.shuffle(selected)
-        return selected[:num_questions]
+        return selected
+    
+    @staticmethod
+    def _target_difficulty(mastery: float) -> str:
+        """Question difficulty that best matches a mastery level."""
+        easy_below, medium_below = MASTERY_DIFFICULTY_CUTS
+        if mastery < easy_below:
+            return 'easy'
+        elif mastery < medium_below:
+            return 'medium'
+        return 'hard'
     
     def generate_topic_quiz(self, course_code: str, topic_id: int,
                             num_questions: int = 5) -> List[dict]:
         """Generate a quiz focused on a single topic."""
-        questions = self.get_questions_for_topic(course_code, topic_id)
+        questions = self.by_topic.get(course_code, {}).get(topic_id, [])
         
         if len(questions) <= num_questions:
-            random.shuffle(questions)
-            return questions
+            return random.sample(questions, len(questions))
         
         # Try to get mix of difficulties
-        easy = [q for q in questions if q.get('difficulty') == 'easy']
-        medium = [q for q in questions if q.get('difficulty') == 'medium']
-        hard = [q for q in questions if q.get('difficulty') == 'hard']
-        
-        random.shuffle(easy)
-        random.shuffle(medium)
-        random.shuffle(hard)
+        index = self.by_topic_diff[course_code]
+        buckets = [index.get((topic_id, difficulty), []) for difficulty in ('easy', 'medium', 'hard')]
         
         # Aim for 30% easy, 50% medium, 20% hard
         n_easy = max(1, int(num_questions * 0.3))
         n_medium = max(1, int(num_questions * 0.5))
-        n_hard = num_questions - n_easy - n_medium
+        n_hard = max(0, num_questions - n_easy - n_medium)
         
-        selected = easy[:n_easy] + medium[:n_medium] + hard[:n_hard]
+        selected = []
+        for bucket, count in zip(buckets, (n_easy, n_medium, n_hard)):
+            selected.extend(random.sample(bucket, min(count, len(bucket))))
         
         # Fill remaining from any category
         remaining = num_questions - len(selected)
-        all_remaining = easy[n_easy:] + medium[n_medium:] + hard[n_hard:]
-        random.shuffle(all_remaining)
-        selected.extend(all_remaining[:remaining])
+        if remaining > 0:
+            taken = set(map(id, selected))
+            leftovers = [q for q in chain.from_iterable(buckets) if id(q) not in taken]
+            selected.extend(random.sample(leftovers, min(remaining, len(leftovers))))
         
         random.shuffle(selected)
-        return selected
+        return selected[:num_questions]
     
     def grade_response(self, question: dict, response: str) -> dict:
         """
@@ -175,20 +325,14 @@ class QuizGenerator:
         Returns:
             Dict with 'correct', 'correct_answer', 'explanation'
         """
-        correct_answer = question.get('correct_answer', '').strip().lower()
+        correct_answer, letters = _answer_key(question.get('correct_answer', ''),
+                                              tuple(question.get('options') or ()))
         user_answer = response.strip().lower()
         
-        is_correct = correct_answer == user_answer
-        
-        # For MCQ, also check option letter
-        if not is_correct and question.get('question_type') == 'mcq':
-            options = question.get('options', [])
-            for i, opt in enumerate(options):
-                if opt.strip().lower() == correct_answer:
-                    # Also accept the option letter (a, b, c, d)
-                    if user_answer == chr(97 + i):
-                        is_correct = True
-                        break
+        # For MCQ, also accept the letter (a, b, c, d) of the correct option
+        is_correct = user_answer == correct_answer or (
+            question.get('question_type') == 'mcq' and user_answer in letters
+        )
         
         return {
             'correct': is_correct,
@@ -207,15 +351,23 @@ class QuizGenerator:
         """
         results = []
         correct_count = 0
+        by_topic = {}  # topic_id -> [correct, total]
         
         for i, (question, response) in enumerate(zip(questions, responses)):
             result = self.grade_response(question, response)
+            topic_id = question.get('topic_id')
             result['question_id'] = question.get('id', i)
-            result['topic_id'] = question.get('topic_id')
+            result['topic_id'] = topic_id
             results.append(result)
             
+            counts = by_topic.get(topic_id)
+            if counts is None:
+                counts = by_topic[topic_id] = [0, 0]
+            counts[1] += 1
+            
             if result['correct']:
                 correct_count += 1
+                counts[0] += 1
         
         total = len(questions)
         percentage = (correct_count / total * 100) if total > 0 else 0
@@ -225,26 +377,17 @@ class QuizGenerator:
             'total': total,
             'percentage': round(percentage, 1),
             'results': results,
-            'topic_breakdown': self._get_topic_breakdown(results)
+            'topic_breakdown': self._format_topic_breakdown(by_topic)
         }
     
-    def _get_topic_breakdown(self, results: List[dict]) -> dict:
-        """Get per-topic score breakdown."""
-        by_topic = {}
-        
-        for result in results:
-            topic_id = result.get('topic_id')
-            if topic_id not in by_topic:
-                by_topic[topic_id] = {'correct': 0, 'total': 0}
-            
-            by_topic[topic_id]['total'] += 1
-            if result['correct']:
-                by_topic[topic_id]['correct'] += 1
-        
-        for topic_id, data in by_topic.items():
-            data['percentage'] = round(data['correct'] / data['total'] * 100, 1)
-        
-        return by_topic
+    @staticmethod
+    def _format_topic_breakdown(by_topic: dict) -> dict:
+        """Build the breakdown dict from {topic_id: [correct, total]}."""
+        return {
+            topic_id: {'correct': correct, 'total': total,
+                       'percentage': round(correct / total * 100, 1)}
+            for topic_id, (correct, total) in by_topic.items()
+        }
 
 
 # Template-based question generation for topics without existing questions
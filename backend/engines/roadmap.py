@@ -6,9 +6,20 @@ Creates personalized week-by-week study plans based on goals and constraints
 import json
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 from pathlib import Path
 
+# orjson is optional; stdlib json is used without it
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+# Parsed course JSON shared across generators: path -> (mtime_ns, data)
+_COURSE_CACHE: Dict[Path, tuple] = {}
+
 
 @dataclass
 class StudySession:
@@ -56,17 +67,51 @@ class RoadmapGenerator:
     - Current mastery levels
     """
     
+    # Study activities per mastery level (beginner also gets a topic-specific reading)
+    _BEGINNER_ACTIVITIES = (
+        "Watch lecture videos if available",
+        "Create concept summary notes",
+        "Try basic practice problems"
+    )
+    _INTERMEDIATE_ACTIVITIES = (
+        "Review key concepts and formulas",
+        "Solve practice problems (medium difficulty)",
+        "Work through past exam questions",
+        "Create flashcards for memorization"
+    )
+    _ADVANCED_ACTIVITIES = (
+        "Attempt challenging problems",
+        "Teach concepts to study partner",
+        "Take practice quizzes",
+        "Review edge cases and exceptions"
+    )
+    
     def __init__(self, courses_path: Path = None):
         self.courses_path = courses_path or Path(__file__).parent.parent / "data" / "courses"
     
     def load_course_data(self, course_code: str) -> dict:
-        """Load course data from JSON file."""
+        """
+        Load course data from JSON file.
+        
+        Parsed files are cached per process and only re-read when their
+        mtime changes. The returned dict is shared, so callers must not mutate it.
+        """
         course_file = self.courses_path / f"{course_code}.json"
         
-        if course_file.exists():
-            with open(course_file, 'r') as f:
-                return json.load(f)
-        return None
+        try:
+            mtime = course_file.stat().st_mtime_ns
+        except OSError:
+            return None
+        
+        cached = _COURSE_CACHE.get(course_file)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        
+        with open(course_file, 'rb') as f:
+            raw = f.read()
+        data = orjson.loads(raw) if HAS_ORJSON else json.loads(raw)
+        _COURSE_CACHE[course_file] = (mtime, data)
+        return data
     
     def generate_roadmap(self, 
                          course_data: dict,
@@ -100,20 +145,10 @@ class RoadmapGenerator:
         days_available = (goal - start).days
         weeks_available = max(1, days_available // 7)
         
-        # Get topics from course
-        topics = course_data.get('topics', [])
-        
-        if not topics:
-            # Fallback: create topics from syllabus weeks
-            syllabus = course_data.get('syllabus', {})
-            for week_num, week_content in syllabus.items():
-                topics.append({
-                    'id': int(week_num) if week_num.isdigit() else len(topics) + 1,
-                    'name': week_content.get('topic', f'Week {week_num}'),
-                    'description': week_content.get('description', ''),
-                    'week': int(week_num) if week_num.isdigit() else len(topics) + 1,
-                    'subtopics': week_content.get('subtopics', [])
-                })
+        # Get topics from course (course_data may be a shared cached dict,
+        # so the syllabus fallback builds its own list)
+        topics = course_data.get('topics') or \
+            self._topics_from_syllabus(course_data.get('syllabus', {}))
         
         # Calculate topic priorities
         topic_priorities = self._calculate_priorities(
@@ -145,24 +180,42 @@ class RoadmapGenerator:
             summary=summary
         )
     
-    def _calculate_priorities(self, topics: List[dict], 
-                               mastery: Dict[int, float],
-                               focus_areas: List[str]) -> Dict[int, float]:
+    @staticmethod
+    def _topics_from_syllabus(syllabus: dict) -> List[dict]:
+        """Fallback: create topics from syllabus weeks."""
+        topics = []
+        for week_num, week_content in syllabus.items():
+            number = int(week_num) if week_num.isdigit() else len(topics) + 1
+            topics.append({
+                'id': number,
+                'name': week_content.get('topic', f'Week {week_num}'),
+                'description': week_content.get('description', ''),
+                'week': number,
+                'subtopics': week_content.get('subtopics', [])
+            })
+        return topics
+
+    @staticmethod
+    def _calculate_priorities(topics: List[dict],
+                              mastery: Dict[int, float],
+                              focus_areas: List[str]) -> Dict[int, float]:
         """Calculate priority score for each topic."""
         priorities = {}
-        
+        focus_lower = [focus.lower() for focus in focus_areas]
+
         for topic in topics:
             topic_id = topic['id']
-            topic_name = topic['name'].lower()
-            
+
             # Base priority from mastery (lower mastery = higher priority)
             current_mastery = mastery.get(topic_id, 0.0)
             priority = 1.0 - current_mastery
-            
-            # Boost for focus areas
-            for focus in focus_areas:
-                if focus.lower() in topic_name:
-                    priority *= 1.5
+
+            # Boost for focus areas (compounds per matching area)
+            if focus_lower:
+                topic_name = topic['name'].lower()
+                matches = sum(focus in topic_name for focus in focus_lower)
+                if matches:
+                    priority *= 1.5 ** matches
             
             # Boost for prerequisites of other topics
             # (Topics early in syllabus are often prerequisites)
@@ -187,13 +240,20 @@ class RoadmapGenerator:
         sorted_topics = sorted(topics, 
             key=lambda t: (t.get('week', 1), -priorities.get(t['id'], 0)))
         
+        # Weak-topic flags in sorted order, sliced per week for quiz recommendations
+        weak_flags = [mastery.get(t['id'], 0) < 0.5 for t in sorted_topics]
+        
         # Calculate topics per week
         topics_per_week = max(1, len(sorted_topics) // num_weeks)
         
+        # Week boundaries advance by whole weeks from the start date
+        one_week = timedelta(weeks=1)
+        six_days = timedelta(days=6)
+        week_start = start_date.date()
+        
         topic_idx = 0
         for week_num in range(1, num_weeks + 1):
-            week_start = start_date + timedelta(weeks=week_num - 1)
-            week_end = week_start + timedelta(days=6)
+            week_end = week_start + six_days
             
             # Get topics for this week
             week_topics = []
@@ -224,17 +284,17 @@ class RoadmapGenerator:
                 time_weight = 0.5 + (topic_priority * 0.3) + ((1 - topic_mastery) * 0.2)
                 session_hours = hours_per_week / topics_this_week * time_weight
                 
-                # Create study session
-                session = StudySession(
-                    topic_id=topic['id'],
-                    topic_name=topic['name'],
-                    duration_hours=round(session_hours, 1),
-                    priority='high' if topic_priority > 0.7 else 
-                             'medium' if topic_priority > 0.4 else 'low',
-                    activities=self._generate_activities(topic, topic_mastery),
-                    resources=topic.get('resources', [])
-                )
-                sessions.append(session)
+                # Create study session (same fields as StudySession, built
+                # directly as the dict stored on the week plan)
+                sessions.append({
+                    'topic_id': topic['id'],
+                    'topic_name': topic['name'],
+                    'duration_hours': round(session_hours, 1),
+                    'priority': 'high' if topic_priority > 0.7 else 
+                                'medium' if topic_priority > 0.4 else 'low',
+                    'activities': self._generate_activities(topic, topic_mastery),
+                    'resources': list(topic.get('resources', []))
+                })
                 
                 topic_idx += 1
             
@@ -259,57 +319,39 @@ class RoadmapGenerator:
                 milestones.append(f"Checkpoint: Review weeks {week_num-2}-{week_num}")
             
             # Recommend quiz every 2 weeks or for weak areas
-            has_weak_topic = any(mastery.get(t['id'], 0) < 0.5 
-                                for t in sorted_topics[topic_idx-topics_this_week:topic_idx])
+            has_weak_topic = any(weak_flags[topic_idx-topics_this_week:topic_idx])
             quiz_recommended = week_num % 2 == 0 or has_weak_topic
             
             week_plan = WeekPlan(
                 week_number=week_num,
-                start_date=week_start.strftime("%Y-%m-%d"),
-                end_date=week_end.strftime("%Y-%m-%d"),
+                start_date=week_start.isoformat(),
+                end_date=week_end.isoformat(),
                 focus_topics=week_topics,
-                total_hours=sum(s.duration_hours for s in sessions),
-                sessions=[asdict(s) for s in sessions],
+                total_hours=sum(s['duration_hours'] for s in sessions),
+                sessions=sessions,
                 milestones=milestones,
                 quiz_recommended=quiz_recommended,
                 reflection=reflection_note
             )
             week_plans.append(week_plan)
+            week_start += one_week
         
         return week_plans
     
     def _generate_activities(self, topic: dict, mastery: float) -> List[str]:
         """Generate recommended study activities based on mastery level."""
-        activities = []
-        
         if mastery < 0.3:
             # Beginner: focus on understanding concepts
-            activities.extend([
-                f"Read course notes on {topic['name']}",
-                "Watch lecture videos if available",
-                "Create concept summary notes",
-                "Try basic practice problems"
-            ])
+            return [f"Read course notes on {topic['name']}", *self._BEGINNER_ACTIVITIES]
         elif mastery < 0.6:
             # Intermediate: practice and apply
-            activities.extend([
-                "Review key concepts and formulas",
-                "Solve practice problems (medium difficulty)",
-                "Work through past exam questions",
-                "Create flashcards for memorization"
-            ])
+            return list(self._INTERMEDIATE_ACTIVITIES)
         else:
             # Advanced: challenge and consolidate
-            activities.extend([
-                "Attempt challenging problems",
-                "Teach concepts to study partner",
-                "Take practice quizzes",
-                "Review edge cases and exceptions"
-            ])
-        
-        return activities[:4]  # Limit to 4 activities
+            return list(self._ADVANCED_ACTIVITIES)
     
-    def _generate_summary(self, course_name: str, weeks: int, 
+    @staticmethod
+    def _generate_summary(course_name: str, weeks: int, 
                           hours: float, weak_topics: List[str],
                           goal_date: str) -> str:
         """Generate a summary of the study plan."""
@@ -351,7 +393,23 @@ class RoadmapGenerator:
         
         return roadmap
     
-    def to_dict(self, roadmap: StudyRoadmap) -> dict:
+    @staticmethod
+    def _week_to_dict(week: WeekPlan) -> dict:
+        """Flat equivalent of dataclasses.asdict for a WeekPlan whose sessions are dicts."""
+        return {
+            'week_number': week.week_number,
+            'start_date': week.start_date,
+            'end_date': week.end_date,
+            'focus_topics': list(week.focus_topics),
+            'total_hours': week.total_hours,
+            'sessions': [dict(s) for s in week.sessions],
+            'milestones': list(week.milestones),
+            'quiz_recommended': week.quiz_recommended,
+            'reflection': week.reflection
+        }
+    
+    @staticmethod
+    def to_dict(roadmap: StudyRoadmap) -> dict:
         """Convert roadmap to dictionary for JSON serialization."""
         return {
             'course_id': roadmap.course_id,
@@ -359,6 +417,7 @@ class RoadmapGenerator:
             'goal_date': roadmap.goal_date,
             'total_weeks': roadmap.total_weeks,
             'hours_per_week': roadmap.hours_per_week,
-            'weeks': [asdict(w) if hasattr(w, '__dict__') else w for w in roadmap.weeks],
+            'weeks': [RoadmapGenerator._week_to_dict(w) if isinstance(w, WeekPlan) else w
+                      for w in roadmap.weeks],
             'summary': roadmap.summary
         }
@@ -3,6 +3,10 @@ Study Pilot AI - Extended Knowledge Base
 Comprehensive offline knowledge for supported courses.
 """
 
+from collections import deque
+from functools import lru_cache
+from typing import Optional
+
 KNOWLEDGE_BASE = {
     # ==========================================
     # DATA STRUCTURES & ALGORITHMS (DSA)
@@ -124,54 +128,141 @@ KNOWLEDGE_BASE = {
     'oop': "OOP Pillars:\n1. Encapsulation (Data hiding)\n2. Inheritance (Reusability)\n3. Polymorphism (Overloading/Overriding)\n4. Abstraction (Interface/Abstract Class)."
 }
 
+# Lookup structures built once at import. Substring trie node keys are
+# single characters; the empty-string key holds the topics found at that node.
+_HITS = ''
+
+
+def _build_substring_trie(topics) -> dict:
+    """
+    Trie over every suffix of every KB topic.
+
+    Each node records the topics passed through, so descending a word
+    answers "which topics contain this word" without scanning the KB.
+    """
+    trie = {}
+    for topic in topics:
+        for start in range(len(topic)):
+            node = trie
+            for ch in topic[start:]:
+                node = node.setdefault(ch, {})
+                node.setdefault(_HITS, set()).add(topic)
+    return trie
+
+
+def _build_phrase_automaton(topics) -> tuple:
+    """
+    Aho-Corasick automaton over the KB topics as (goto, fail, output).
+
+    States are list indices with 0 as the root. output[state] holds every
+    topic ending at that state, including those reached through fail links,
+    so one pass over a text reports all contained topics.
+    """
+    goto = [{}]
+    output = [()]
+    for topic in topics:
+        state = 0
+        for ch in topic:
+            nxt = goto[state].get(ch)
+            if nxt is None:
+                nxt = len(goto)
+                goto[state][ch] = nxt
+                goto.append({})
+                output.append(())
+            state = nxt
+        output[state] += (topic,)
+    
+    # Breadth-first, so a state's fail target is finished before its children
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for ch, nxt in goto[state].items():
+            queue.append(nxt)
+            target = fail[state]
+            while target and ch not in goto[target]:
+                target = fail[target]
+            fail[nxt] = goto[target].get(ch, 0)
+            output[nxt] += output[fail[nxt]]
+    return goto, fail, output
+
+
+_SUBSTRING_TRIE = _build_substring_trie(KNOWLEDGE_BASE)
+_PHRASE_GOTO, _PHRASE_FAIL, _PHRASE_OUTPUT = _build_phrase_automaton(KNOWLEDGE_BASE)
+_TOPIC_ORDER = {topic: i for i, topic in enumerate(KNOWLEDGE_BASE)}
+_CITATIONS = {topic: f'Study Pilot Knowledge Base: {topic.title()}' for topic in KNOWLEDGE_BASE}
+
+
+def _topics_containing(word: str) -> set:
+    """Topics that contain word as a substring."""
+    node = _SUBSTRING_TRIE
+    for ch in word:
+        node = node.get(ch)
+        if node is None:
+            return set()
+    return node[_HITS]
+
+
+def _topics_in(text: str) -> set:
+    """Topics that occur as a substring of text, in one pass over it."""
+    found = set()
+    state = 0
+    for ch in text:
+        while state and ch not in _PHRASE_GOTO[state]:
+            state = _PHRASE_FAIL[state]
+        state = _PHRASE_GOTO[state].get(ch, 0)
+        found.update(_PHRASE_OUTPUT[state])
+    return found
+
+
 def get_smart_answer(query: str) -> dict:
     """
     Enhanced search with fuzzy matching and keyword scoring.
     """
-    query_lower = query.lower()
+    topic = _match_topic(query.lower())
+    if topic is None:
+        return None
     
-    # Direct match check
-    if query_lower in KNOWLEDGE_BASE:
-        return _format_answer(query_lower, KNOWLEDGE_BASE[query_lower])
-        
-    # Keyword scoring approach
-    best_key = None
-    best_score = 0
-    words = query_lower.split()
-    
-    for topic, content in KNOWLEDGE_BASE.items():
-        topic_words = topic.split()
-        
-        # Calculate match score
-        score = 0
-        
-        # Full phrase match gets huge bonus
-        if topic in query_lower:
-            score += 50
-            
-        # Partial phrase match
-        for word in words:
-            if len(word) > 3 and word in topic: # Skip small words
-                score += 10
-                
-        # Update best match if threshold met
-        if score > best_score and score > 15:
-            best_score = score
-            best_key = topic
-            
-    if best_key:
-        return _format_answer(best_key, KNOWLEDGE_BASE[best_key])
-        
-    return None
-
-def _format_answer(topic: str, content: str) -> dict:
+    # Built per call so callers never share a mutable answer
     return {
-        'answer': content,
+        'answer': KNOWLEDGE_BASE[topic],
         'citations': [{
             'index': 1,
-            'citation': f'Study Pilot Knowledge Base: {topic.title()}',
+            'citation': _CITATIONS[topic],
             'score': 1.0
         }],
         'confidence': 0.95,
         'sources': ['Study Pilot AI Core Knowledge']
     }
+
+
+@lru_cache(maxsize=1024)
+def _match_topic(query_lower: str) -> Optional[str]:
+    """KB topic that best answers a lowercased query, or None."""
+    # Direct match check
+    if query_lower in KNOWLEDGE_BASE:
+        return query_lower
+        
+    # Keyword scoring approach, only over topics the tries say can match
+    scores = {}
+    
+    # Full phrase match gets huge bonus
+    for topic in _topics_in(query_lower):
+        scores[topic] = 50
+    
+    # Partial phrase match
+    for word in query_lower.split():
+        if len(word) > 3:  # Skip small words
+            for topic in _topics_containing(word):
+                scores[topic] = scores.get(topic, 0) + 10
+    
+    # Best score above the threshold; ties go to the earliest KB entry
+    best_key = None
+    best_score = 15
+    for topic, score in scores.items():
+        if score > best_score or (score == best_score and best_key is not None
+                                  and _TOPIC_ORDER[topic] < _TOPIC_ORDER[best_key]):
+            best_score = score
+            best_key = topic
+    
+    return best_key
@@ -2,6 +2,9 @@ import os
 import urllib.request
 import urllib.error
 import json
+import hashlib
+import threading
+from collections import OrderedDict
 
 # Try to load dotenv, but it's optional (env vars can be set directly on Render)
 try:
@@ -10,27 +13,109 @@ try:
 except ImportError:
     pass  # dotenv not installed, assume env vars are set directly
 
-def get_openai_answer(query: str, context_text: str = "", history: list = None) -> dict:
-    """
-    Get an answer from OpenAI (ChatGPT) using standard library (urllib).
-    Returns None if offline or no key.
-    """
-    api_key = os.getenv('OPENAI_API_KEY')
-    if not api_key:
-        return None
-        
-    url = "https://api.openai.com/v1/chat/completions"
-    
-    # Construct messages array
-    messages = [
-        {
-            "role": "system", 
-            "content": """You are Study Pilot AI, an advanced educational assistant for university students.
+# orjson is optional; stdlib json is used without it
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+# requests keeps TLS connections to the API alive between calls; without it
+# each call opens its own connection through urllib
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    HAS_REQUESTS = True
+except ImportError:
+    HAS_REQUESTS = False
+
+OPENAI_URL = "https://api.openai.com/v1/chat/completions"
+REQUEST_TIMEOUT = 10  # seconds
+
+# Read once at import (after .env is loaded); restart to pick up a new key
+_API_KEY = os.getenv('OPENAI_API_KEY')
+_HEADERS = {
+    "Content-Type": "application/json",
+    "Authorization": f"Bearer {_API_KEY}"
+} if _API_KEY else None
+
+_SYSTEM_MESSAGE = {
+    "role": "system", 
+    "content": """You are Study Pilot AI, an advanced educational assistant for university students.
             Answer the student's question accurately, concisely, and academically.
             Use clear formatting (bullet points, bold text).
             Maintain a friendly, encouraging, and helpful tone."""
-        }
-    ]
+}
+
+
+def _create_session():
+    """Pooled session; sized for the app's cloud-llm thread pool, retrying failed connects."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=32,
+                          max_retries=Retry(total=2, backoff_factor=0.5))
+    session.mount("https://", adapter)
+    return session
+
+
+_SESSION = _create_session() if HAS_REQUESTS else None
+
+
+def _dumps(obj) -> bytes:
+    """Encode a request body or cache key as UTF-8 JSON."""
+    return orjson.dumps(obj) if HAS_ORJSON else json.dumps(obj).encode('utf-8')
+
+
+def _loads(raw):
+    """Decode a JSON response body (bytes or str)."""
+    return orjson.loads(raw) if HAS_ORJSON else json.loads(raw)
+
+# Answers to repeated questions, most recently used last
+ANSWER_CACHE_SIZE = 256
+_ANSWER_CACHE = OrderedDict()  # (query, context hash, history hash) -> answer text
+_ANSWER_CACHE_LOCK = threading.Lock()
+
+
+def _answer_key(query: str, context_text: str, history: list) -> tuple:
+    """Cache key; the query is compared ignoring case and extra whitespace."""
+    turns = [(msg.get('type') == 'user', msg.get('content', '')) for msg in history or ()]
+    context_hash = hashlib.blake2b(context_text.encode('utf-8'), digest_size=16).hexdigest()
+    history_hash = hashlib.blake2b(_dumps(turns), digest_size=16).hexdigest()
+    return ' '.join(query.lower().split()), context_hash, history_hash
+
+
+def _cached_answer(key: tuple):
+    """Answer text for a key, or None; marks a hit as recently used."""
+    with _ANSWER_CACHE_LOCK:
+        answer_text = _ANSWER_CACHE.get(key)
+        if answer_text is not None:
+            _ANSWER_CACHE.move_to_end(key)
+        return answer_text
+
+
+def _remember_answer(key: tuple, answer_text: str):
+    """Store an answer, evicting the least recently used one when full."""
+    with _ANSWER_CACHE_LOCK:
+        _ANSWER_CACHE[key] = answer_text
+        _ANSWER_CACHE.move_to_end(key)
+        if len(_ANSWER_CACHE) > ANSWER_CACHE_SIZE:
+            _ANSWER_CACHE.popitem(last=False)
+
+
+def _cloud_result(answer_text: str) -> dict:
+    return {
+        'answer': answer_text,
+        'citations': [],
+        'confidence': 0.99,
+        'sources': ['ChatGPT (Cloud Logic)']
+    }
+
+
+def _build_payload(query: str, context_text: str, history: list,
+                   stream: bool = False) -> dict:
+    """Chat completion payload for a question with optional context and history."""
+    # Construct messages array
+    messages = [_SYSTEM_MESSAGE]
     
     # Add history if available
     if history:
@@ -51,27 +136,116 @@ def get_openai_answer(query: str, context_text: str = "", history: list = None)
         "temperature": 0.3,
         "max_tokens": 1000
     }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+
+def get_openai_answer(query: str, context_text: str = "", history: list = None) -> dict:
+    """
+    Get an answer from OpenAI (ChatGPT) over a pooled requests session,
+    or the standard library (urllib) without requests.
+    Repeated questions with the same context and history are answered
+    from an in-process LRU cache. Returns None if offline or no key.
+    """
+    if not _API_KEY:
+        return None
     
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
+    key = _answer_key(query, context_text, history)
+    answer_text = _cached_answer(key)
+    if answer_text is not None:
+        return _cloud_result(answer_text)
+    
+    payload = _build_payload(query, context_text, history)
     
     try:
-        data = json.dumps(payload).encode('utf-8')
-        req = urllib.request.Request(url, data=data, headers=headers)
+        if _SESSION is not None:
+            response = _SESSION.post(OPENAI_URL, data=_dumps(payload), headers=_HEADERS,
+                                     timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            result = _loads(response.content)
+        else:
+            req = urllib.request.Request(OPENAI_URL, data=_dumps(payload), headers=_HEADERS)
+            with urllib.request.urlopen(req, timeout=REQUEST_TIMEOUT) as response:
+                result = _loads(response.read())
+        
+        answer_text = result['choices'][0]['message']['content']
+        _remember_answer(key, answer_text)
+        
+        return _cloud_result(answer_text)
         
-        with urllib.request.urlopen(req, timeout=10) as response:
-            result = json.loads(response.read().decode())
-            answer_text = result['choices'][0]['message']['content']
-            
-            return {
-                'answer': answer_text,
-                'citations': [],
-                'confidence': 0.99,
-                'sources': ['ChatGPT (Cloud Logic)']
-            }
-            
     except Exception as e:
         print(f"Cloud LLM request failed: {e}")
         return None
+
+
+class CloudStreamError(Exception):
+    """A streamed answer failed or ended before it was complete."""
+
+
+def stream_openai_answer(query: str, context_text: str = "", history: list = None):
+    """
+    Stream an answer from OpenAI as it is generated.
+    
+    Yields text fragments parsed from the server-sent event stream, or
+    nothing without a key. Raises CloudStreamError if the request fails or
+    the stream ends before [DONE], whether or not fragments were already
+    yielded. Cached answers come back as a single fragment, and only
+    complete streamed answers are cached.
+    """
+    if not _API_KEY:
+        return
+    
+    key = _answer_key(query, context_text, history)
+    answer_text = _cached_answer(key)
+    if answer_text is not None:
+        yield answer_text
+        return
+    
+    payload = _build_payload(query, context_text, history, stream=True)
+    fragments = []
+    
+    try:
+        if _SESSION is not None:
+            with _SESSION.post(OPENAI_URL, data=_dumps(payload), headers=_HEADERS,
+                               timeout=REQUEST_TIMEOUT, stream=True) as response:
+                response.raise_for_status()
+                complete = yield from _parse_sse(
+                    response.iter_lines(decode_unicode=True), fragments)
+        else:
+            req = urllib.request.Request(OPENAI_URL, data=_dumps(payload), headers=_HEADERS)
+            with urllib.request.urlopen(req, timeout=REQUEST_TIMEOUT) as response:
+                complete = yield from _parse_sse(
+                    (line.decode('utf-8') for line in response), fragments)
+        
+    except Exception as e:
+        print(f"Cloud LLM stream failed: {e}")
+        raise CloudStreamError(str(e)) from e
+    
+    if not complete:
+        print("Cloud LLM stream ended before [DONE]")
+        raise CloudStreamError("stream ended before [DONE]")
+    if fragments:
+        _remember_answer(key, ''.join(fragments))
+
+
+def _parse_sse(lines, fragments: list):
+    """
+    Yield the content deltas from chat-completion SSE lines until [DONE],
+    keeping them in fragments. Returns whether [DONE] was reached.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line.startswith("data:"):
+            continue
+        
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return True
+        
+        choices = _loads(data).get('choices') or ({},)
+        content = choices[0].get('delta', {}).get('content')
+        if content:
+            fragments.append(content)
+            yield content
+    return False
@@ -3,10 +3,17 @@ Study Pilot AI - Embeddings Module
 Sentence-transformers for CPU-only semantic embeddings
 """
 
+import atexit
+import hashlib
+import os
+import threading
+import weakref
 import numpy as np
+from contextlib import contextmanager
 from pathlib import Path
 from typing import List, Union, Optional
 import json
+import zlib
 
 # Try to import sentence-transformers
 try:
@@ -15,25 +22,68 @@ try:
 except ImportError:
     HAS_SENTENCE_TRANSFORMERS = False
 
+# ONNX Runtime is optional; an exported (int8-quantized) MiniLM runs
+# without torch, which keeps the embedding model within small instances
+try:
+    import onnxruntime as ort
+    from tokenizers import Tokenizer
+    HAS_ONNXRUNTIME = True
+except ImportError:
+    HAS_ONNXRUNTIME = False
+
+# orjson is optional; stdlib json is used without it
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+# fcntl (POSIX) lets processes sharing an EmbeddingCache directory coordinate
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
 
 class EmbeddingModel:
     """
     Wrapper for sentence-transformers embedding model.
-    Falls back to simple TF-IDF-like embeddings if not available.
+    
+    Prefers an ONNX export of the model under cache_dir/<model>-onnx/
+    (model.int8.onnx or model.onnx, plus tokenizer.json), e.g. produced with
+    `optimum-cli export onnx` and onnxruntime's quantize_dynamic.
+    Falls back to simple TF-IDF-like embeddings if neither is available.
     """
     
     # Default model - small and efficient for CPU
     DEFAULT_MODEL = "all-MiniLM-L6-v2"
     EMBEDDING_DIM = 384  # Dimension for MiniLM
     
+    # int8 document storage: unit vectors scaled to [-127, 127]; scored in
+    # row blocks so the int32 upcast never copies the whole matrix
+    INT8_SCALE = 127
+    INT8_BLOCK_ROWS = 4096
+    
+    # ONNX export files, in order of preference, and MiniLM's token limit
+    ONNX_MODEL_FILES = ("model.int8.onnx", "model.onnx")
+    ONNX_MAX_TOKENS = 256
+    
     def __init__(self, model_name: str = None, cache_dir: Path = None):
         self.model_name = model_name or self.DEFAULT_MODEL
         self.cache_dir = cache_dir or Path(__file__).parent.parent / "data" / "models"
         self.model = None
+        self.onnx_session = None
+        self.tokenizer = None
+        self._doc_norm = None  # Normalized document matrix from index()
+        self._doc_int8 = None  # Quantized document matrix from index(quantize=True)
         self._load_model()
     
     def _load_model(self):
         """Load the embedding model."""
+        if HAS_ONNXRUNTIME and self._load_onnx_model():
+            return
+        
         if HAS_SENTENCE_TRANSFORMERS:
             try:
                 self.model = SentenceTransformer(
@@ -47,6 +97,30 @@ class EmbeddingModel:
         else:
             print("sentence-transformers not installed. Using fallback embeddings.")
     
+    def _load_onnx_model(self) -> bool:
+        """Load an ONNX export of the model if one is present."""
+        model_dir = self.cache_dir / f"{self.model_name}-onnx"
+        tokenizer_file = model_dir / "tokenizer.json"
+        model_file = next((model_dir / name for name in self.ONNX_MODEL_FILES
+                           if (model_dir / name).exists()), None)
+        if model_file is None or not tokenizer_file.exists():
+            return False
+        
+        try:
+            self.onnx_session = ort.InferenceSession(str(model_file),
+                                                     providers=["CPUExecutionProvider"])
+            self.tokenizer = Tokenizer.from_file(str(tokenizer_file))
+            self.tokenizer.enable_padding()
+            self.tokenizer.enable_truncation(max_length=self.ONNX_MAX_TOKENS)
+            self._onnx_inputs = {i.name for i in self.onnx_session.get_inputs()}
+            print(f"Loaded ONNX embedding model: {model_file.name}")
+            return True
+        except Exception as e:
+            print(f"Error loading ONNX model: {e}")
+            self.onnx_session = None
+            self.tokenizer = None
+            return False
+    
     def embed(self, texts: Union[str, List[str]], 
               show_progress: bool = False) -> np.ndarray:
         """
@@ -69,52 +143,105 @@ class EmbeddingModel:
                 convert_to_numpy=True
             )
             return embeddings
+        elif self.onnx_session is not None:
+            return self._onnx_embed(texts)
         else:
             # Fallback: simple bag-of-words style embedding
             return self._fallback_embed(texts)
     
+    def _onnx_embed(self, texts: List[str]) -> np.ndarray:
+        """Embed with the ONNX model: mean-pool token states, then L2-normalize."""
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        
+        feeds = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if 'token_type_ids' in self._onnx_inputs:
+            feeds['token_type_ids'] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        token_states = self.onnx_session.run(None, feeds)[0]
+        
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (token_states * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return (pooled / norms).astype(np.float32)
+    
     def _fallback_embed(self, texts: List[str]) -> np.ndarray:
         """
         Fallback embedding using simple word hashing.
         Not as good as transformers but works without dependencies.
         """
-        embeddings = []
+        # Hash every word to a dimension index in one pass, then count
+        # (document, index) pairs with a single bincount. CRC32 is stable
+        # across processes (unlike hash()), so saved fallback vectors still
+        # line up with query vectors after a restart.
+        word_lists = [text.lower().split() for text in texts]
+        n_words = sum(len(words) for words in word_lists)
+        indices = np.fromiter(
+            (zlib.crc32(word.encode()) % self.EMBEDDING_DIM
+             for words in word_lists for word in words),
+            dtype=np.int64, count=n_words
+        )
+        doc_ids = np.repeat(np.arange(len(texts)), [len(words) for words in word_lists])
+        counts = np.bincount(doc_ids * self.EMBEDDING_DIM + indices,
+                             minlength=len(texts) * self.EMBEDDING_DIM)
+        embeddings = counts.reshape(len(texts), self.EMBEDDING_DIM).astype(np.float64)
         
-        for text in texts:
-            # Simple hash-based embedding
-            words = text.lower().split()
-            vec = np.zeros(self.EMBEDDING_DIM)
-            
-            for word in words:
-                # Hash word to dimension index
-                idx = hash(word) % self.EMBEDDING_DIM
-                vec[idx] += 1
-            
-            # Normalize
-            norm = np.linalg.norm(vec)
-            if norm > 0:
-                vec = vec / norm
-            
-            embeddings.append(vec)
+        # Normalize
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        embeddings /= norms
         
-        return np.array(embeddings, dtype=np.float32)
+        return embeddings.astype(np.float32)
     
     def embed_query(self, query: str) -> np.ndarray:
         """Embed a single query text."""
         return self.embed([query])[0]
     
     def embed_documents(self, documents: List[str], 
-                        batch_size: int = 32) -> np.ndarray:
+                        batch_size: int = 32,
+                        cache: 'EmbeddingCache' = None) -> np.ndarray:
         """
         Embed a list of documents with batching.
         
         Args:
             documents: List of document texts
             batch_size: Batch size for processing
+            cache: Optional EmbeddingCache keyed by model and text hash;
+                only documents missing from it are encoded
             
         Returns:
             numpy array of embeddings
         """
+        # Fallback embeddings are cheap word-hash counts; only transformer
+        # embeddings are worth caching
+        uses_fallback = self.model is None and self.onnx_session is None
+        if cache is None or uses_fallback or not documents:
+            return self._embed_batches(documents, batch_size)
+        
+        keys = [self._cache_key(doc) for doc in documents]
+        embeddings = [cache.get(key) for key in keys]
+        
+        # Encode each distinct missing text once
+        misses = {}  # key -> positions in documents
+        for i, embedding in enumerate(embeddings):
+            if embedding is None:
+                misses.setdefault(keys[i], []).append(i)
+        
+        if misses:
+            fresh = self._embed_batches([documents[positions[0]] for positions in misses.values()],
+                                        batch_size)
+            for (key, positions), embedding in zip(misses.items(), fresh):
+                cache.set(key, embedding)
+                for i in positions:
+                    embeddings[i] = embedding
+            cache.flush()
+        
+        return np.vstack(embeddings)
+    
+    def _embed_batches(self, documents: List[str], batch_size: int) -> np.ndarray:
+        """Embed documents batch_size at a time."""
         all_embeddings = []
         
         for i in range(0, len(documents), batch_size):
@@ -124,77 +251,284 @@ class EmbeddingModel:
         
         return np.vstack(all_embeddings)
     
+    def _cache_key(self, text: str) -> str:
+        """Embedding cache key for a text under this model."""
+        return hashlib.blake2b(f"{self.model_name}\0{text}".encode(), digest_size=16).hexdigest()
+    
+    @classmethod
+    def quantize_int8(cls, embeddings: np.ndarray) -> np.ndarray:
+        """L2-normalize embedding rows and round them to int8 (dot / INT8_SCALE**2 ~ cosine)."""
+        embeddings = np.atleast_2d(embeddings).astype(np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1  # Avoid division by zero
+        return np.round(embeddings / norms * cls.INT8_SCALE).astype(np.int8)
+    
+    def index(self, doc_embeddings: np.ndarray, quantize: bool = False):
+        """
+        Normalize document embeddings once for repeated similarity queries.
+        
+        Args:
+            doc_embeddings: Document embeddings (2D)
+            quantize: Store the matrix as int8 (4x less memory; scores
+                stay within about 0.01 of float cosine similarity)
+        """
+        if quantize:
+            self._doc_int8 = self.quantize_int8(doc_embeddings)
+            self._doc_norm = None
+            return
+        
+        norms = np.linalg.norm(doc_embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1  # Avoid division by zero
+        self._doc_norm = np.ascontiguousarray(doc_embeddings / norms, dtype=np.float32)
+        self._doc_int8 = None
+    
     def similarity(self, query_embedding: np.ndarray, 
-                   doc_embeddings: np.ndarray) -> np.ndarray:
+                   doc_embeddings: np.ndarray = None) -> np.ndarray:
         """
         Calculate cosine similarity between query and documents.
         
         Args:
             query_embedding: Query embedding (1D or 2D)
-            doc_embeddings: Document embeddings (2D)
+            doc_embeddings: Document embeddings (2D); defaults to the
+                matrix normalized by index(), which skips per-call normalization
             
         Returns:
             Similarity scores for each document
         """
-        if query_embedding.ndim == 1:
-            query_embedding = query_embedding.reshape(1, -1)
+        query_embedding = query_embedding.reshape(-1)
+        if doc_embeddings is None and self._doc_int8 is not None:
+            return self._similarity_int8(query_embedding)
         
-        # Normalize
-        query_norm = query_embedding / np.linalg.norm(query_embedding, axis=1, keepdims=True)
-        doc_norm = doc_embeddings / np.linalg.norm(doc_embeddings, axis=1, keepdims=True)
+        query_norm = (query_embedding / np.linalg.norm(query_embedding)).astype(np.float32)
         
-        # Cosine similarity via dot product
-        similarities = np.dot(query_norm, doc_norm.T).flatten()
+        # Cosine similarity as a single matrix-vector product
+        if doc_embeddings is None:
+            return self._doc_norm @ query_norm
         
-        return similarities
+        # Scale the dot products by the row norms instead of normalizing a
+        # copy of the matrix; einsum sums the squares without an (N, D) temporary
+        doc_norms = np.sqrt(np.einsum('ij,ij->i', doc_embeddings, doc_embeddings))
+        return (doc_embeddings @ query_norm) / doc_norms
+    
+    def _similarity_int8(self, query_embedding: np.ndarray) -> np.ndarray:
+        """Cosine similarity against the int8 document matrix."""
+        return self.int8_similarity(self._doc_int8, query_embedding)
+    
+    @classmethod
+    def int8_similarity(cls, doc_int8: np.ndarray, query_embedding: np.ndarray) -> np.ndarray:
+        """Cosine similarity of a query against rows from quantize_int8."""
+        # Integer dot products of 127-scaled codes stay below 2**24 for
+        # D <= 1040, so float32 BLAS (SGEMV) computes them exactly and is
+        # faster than NumPy's non-BLAS integer matmul
+        query = cls.quantize_int8(query_embedding)[0].astype(np.float32)
+        scores = np.empty(len(doc_int8), dtype=np.float32)
+        for start in range(0, len(doc_int8), cls.INT8_BLOCK_ROWS):
+            block = doc_int8[start:start + cls.INT8_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ query
+        scores /= cls.INT8_SCALE ** 2
+        return scores
     
     @property
     def dimension(self) -> int:
         """Get embedding dimension."""
         if self.model is not None:
             return self.model.get_sentence_embedding_dimension()
+        if self.onnx_session is not None:
+            dim = self.onnx_session.get_outputs()[0].shape[-1]
+            if isinstance(dim, int):
+                return dim
         return self.EMBEDDING_DIM
 
 
+# Caches still open at exit get a final flush; held weakly so that
+# instances can be freed before then
+_OPEN_CACHES = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_open_caches():
+    for cache in list(_OPEN_CACHES):
+        cache.flush()
+
+
 class EmbeddingCache:
-    """Cache embeddings to disk to avoid recomputation."""
+    """
+    Cache embeddings to disk to avoid recomputation.
     
-    def __init__(self, cache_dir: Path = None):
+    Vectors are rows of a single memory-mapped float16 matrix (half the
+    bytes of float32, cosine similarity within ~1e-3); metadata.json maps
+    each key to its row, so a hit is an index into the mapping rather than
+    a file open. Metadata is written every METADATA_FLUSH_EVERY sets, on
+    flush() and at exit.
+    
+    An instance is safe to share between threads. Processes may share a
+    cache_dir: rows are handed out from a counter file under an fcntl lock,
+    and flush() merges in metadata saved by other processes. A process that
+    dies before flushing only leaves its newest rows unused. Without fcntl
+    (Windows), give each process its own cache_dir.
+    """
+    
+    DATA_FILE = "embeddings.f16.dat"
+    LOCK_FILE = "cache.lock"
+    NEXT_ROW_FILE = "next_row"
+    DTYPE = np.float16
+    INITIAL_ROWS = 1024
+    METADATA_FLUSH_EVERY = 100
+    
+    def __init__(self, cache_dir: Path = None, dim: int = EmbeddingModel.EMBEDDING_DIM):
         self.cache_dir = cache_dir or Path(__file__).parent.parent / "data" / "embedding_cache"
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         self.metadata_file = self.cache_dir / "metadata.json"
-        self.metadata = self._load_metadata()
+        self.data_file = self.cache_dir / self.DATA_FILE
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._lock_depth = 0  # Nesting of _locked() in the thread holding _lock
+        self._matrix = None  # np.memmap over data_file, opened on first use
+        self._unsaved = 0
+        
+        with self._locked():
+            self.metadata = self._load_metadata()
+            if not self.data_file.exists():
+                # Rows from an earlier data file cannot be served from this one
+                self.metadata = {key: info for key, info in self.metadata.items()
+                                 if 'row' not in info}
+                (self.cache_dir / self.NEXT_ROW_FILE).unlink(missing_ok=True)
+        _OPEN_CACHES.add(self)
+    
+    @contextmanager
+    def _locked(self):
+        """Hold this instance's lock and, where available, the directory's file lock."""
+        with self._lock:
+            # flock on a second descriptor would block on our own lock, so
+            # nested calls (set -> flush) only count their depth
+            if not HAS_FCNTL or self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            with open(self.cache_dir / self.LOCK_FILE, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _allocate_row(self) -> int:
+        """Reserve the next free row of the data file (call under _locked)."""
+        next_row_file = self.cache_dir / self.NEXT_ROW_FILE
+        if next_row_file.exists():
+            row = int(next_row_file.read_text())
+        else:
+            # Caches written before the counter existed continue after their rows
+            row = 1 + max((m['row'] for m in self.metadata.values() if 'row' in m),
+                          default=-1)
+        self._replace_file(next_row_file, str(row + 1).encode())
+        return row
+    
+    @staticmethod
+    def _replace_file(path: Path, data: bytes):
+        """Write a file atomically, so a crash never leaves it truncated."""
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
     
     def _load_metadata(self) -> dict:
         """Load cache metadata."""
         if self.metadata_file.exists():
-            with open(self.metadata_file, 'r') as f:
-                return json.load(f)
+            with open(self.metadata_file, 'rb') as f:
+                raw = f.read()
+            return orjson.loads(raw) if HAS_ORJSON else json.loads(raw)
         return {}
     
-    def _save_metadata(self):
-        """Save cache metadata."""
-        with open(self.metadata_file, 'w') as f:
-            json.dump(self.metadata, f)
+    def _save_metadata(self, merge: bool = True):
+        """Save cache metadata, first merging entries other processes saved (call under _locked)."""
+        if merge:
+            merged = self._load_metadata()
+            merged.update(self.metadata)
+            self.metadata = merged
+        self._replace_file(self.metadata_file,
+                           orjson.dumps(self.metadata) if HAS_ORJSON
+                           else json.dumps(self.metadata).encode('utf-8'))
+        self._unsaved = 0
+    
+    def _rows(self, min_rows: int = 0) -> Optional[np.memmap]:
+        """Memory-mapped row matrix, grown (doubling) to hold at least min_rows."""
+        if self._matrix is not None and len(self._matrix) >= min_rows:
+            return self._matrix
+        
+        row_bytes = self.dim * np.dtype(self.DTYPE).itemsize
+        capacity = self.data_file.stat().st_size // row_bytes if self.data_file.exists() else 0
+        
+        if capacity < min_rows:
+            if self._matrix is not None:
+                self._matrix.flush()
+                self._matrix = None
+            capacity = max(self.INITIAL_ROWS, 2 * capacity, min_rows)
+            with open(self.data_file, 'ab') as f:
+                f.truncate(capacity * row_bytes)
+        
+        if capacity == 0:
+            return None
+        if self._matrix is None or len(self._matrix) != capacity:
+            self._matrix = np.memmap(self.data_file, dtype=self.DTYPE, mode='r+',
+                                     shape=(capacity, self.dim))
+        return self._matrix
     
     def get(self, key: str) -> Optional[np.ndarray]:
-        """Get cached embedding by key."""
-        if key in self.metadata:
+        """Get cached embedding by key (as float32)."""
+        info = self.metadata.get(key)
+        if info is None:
+            return None
+        
+        if 'row' not in info:
+            # Entry written by the older one-file-per-key layout
             cache_file = self.cache_dir / f"{key}.npy"
-            if cache_file.exists():
-                return np.load(cache_file)
-        return None
+            return np.load(cache_file) if cache_file.exists() else None
+        
+        row = info['row']
+        with self._lock:
+            matrix = self._rows()
+            if matrix is not None and row >= len(matrix):
+                # Another process grew the data file; map it again
+                self._matrix = None
+                matrix = self._rows()
+            if matrix is None or row >= len(matrix):
+                return None
+            return matrix[row].astype(np.float32).reshape(info['shape'])
     
     def set(self, key: str, embedding: np.ndarray, text_hash: str = None):
-        """Cache an embedding."""
-        cache_file = self.cache_dir / f"{key}.npy"
-        np.save(cache_file, embedding)
+        """Cache an embedding (it must hold exactly dim values)."""
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        if vector.size != self.dim:
+            raise ValueError(f"Expected {self.dim} values, got {vector.size}")
         
-        self.metadata[key] = {
-            'text_hash': text_hash,
-            'shape': list(embedding.shape)
-        }
-        self._save_metadata()
+        with self._locked():
+            info = self.metadata.get(key)
+            row = info['row'] if info is not None and 'row' in info else self._allocate_row()
+            
+            self._rows(row + 1)[row] = vector
+            self.metadata[key] = {
+                'row': row,
+                'text_hash': text_hash,
+                'shape': list(np.shape(embedding))
+            }
+            
+            self._unsaved += 1
+            if self._unsaved >= self.METADATA_FLUSH_EVERY:
+                self.flush()
+    
+    def flush(self):
+        """Write pending rows and metadata to disk."""
+        with self._locked():
+            if self._matrix is not None:
+                self._matrix.flush()
+            if self._unsaved:
+                self._save_metadata()
     
     def has(self, key: str, text_hash: str = None) -> bool:
         """Check if key exists in cache (with optional hash validation)."""
@@ -204,11 +538,18 @@ class EmbeddingCache:
         if text_hash and self.metadata[key].get('text_hash') != text_hash:
             return False
         
+        if 'row' in self.metadata[key]:
+            return True
         return (self.cache_dir / f"{key}.npy").exists()
     
     def clear(self):
         """Clear all cached embeddings."""
-        for f in self.cache_dir.glob("*.npy"):
-            f.unlink()
-        self.metadata = {}
-        self._save_metadata()
+        with self._locked():
+            self._matrix = None
+            for f in self.cache_dir.glob("embeddings*.dat"):
+                f.unlink()
+            for f in self.cache_dir.glob("*.npy"):
+                f.unlink()
+            (self.cache_dir / self.NEXT_ROW_FILE).unlink(missing_ok=True)
+            self.metadata = {}
+            self._save_metadata(merge=False)
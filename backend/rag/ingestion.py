@@ -3,11 +3,14 @@ Study Pilot AI - Document Ingestion Pipeline
 Parse PDFs, PowerPoints, and text files for RAG
 """
 
+import os
 import re
 import json
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
-from dataclasses import dataclass, asdict
+from typing import Iterator, List, Dict, Tuple, Optional
+from dataclasses import dataclass
 
 # PDF parsing
 try:
@@ -16,6 +19,13 @@ try:
 except ImportError:
     HAS_PYPDF = False
 
+# pypdfium2 (PDFium bindings) extracts text natively; preferred over PyPDF2
+try:
+    import pypdfium2 as pdfium
+    HAS_PDFIUM = True
+except ImportError:
+    HAS_PDFIUM = False
+
 # PowerPoint parsing
 try:
     from pptx import Presentation
@@ -23,8 +33,19 @@ try:
 except ImportError:
     HAS_PPTX = False
 
+# Text cleanup patterns, compiled once for the per-page _clean_text calls
+_WS_RE = re.compile(r'\s+')
+_STRIP_RE = re.compile(r'[^\w\s.,;:!?\-\(\)\[\]\'\"]+')
+
+# Sentence separators a chunk may end on, in order of preference
+_SENTENCE_SEPS = tuple((sep, re.compile(re.escape(sep))) for sep in ('. ', '! ', '? ', '\n'))
 
-@dataclass
+# Processes used to parse a directory's files; parsing is CPU-bound and holds
+# the GIL. Defaults to serial, since each process is forked from the web worker
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', 1))
+
+
+@dataclass(slots=True)
 class DocumentChunk:
     """A chunk of document content for embedding."""
     id: str
@@ -76,17 +97,14 @@ class DocumentIngester:
     
     def ingest_pdf(self, file_path: Path, course_id: int = None) -> List[DocumentChunk]:
         """Extract and chunk content from PDF."""
-        if not HAS_PYPDF:
-            print("PyPDF2 not installed. Cannot process PDFs.")
+        if not (HAS_PDFIUM or HAS_PYPDF):
+            print("Neither pypdfium2 nor PyPDF2 installed. Cannot process PDFs.")
             return []
         
         chunks = []
         
         try:
-            reader = PdfReader(str(file_path))
-            
-            for page_num, page in enumerate(reader.pages, 1):
-                text = page.extract_text() or ""
+            for page_num, text in enumerate(self._pdf_page_texts(file_path), 1):
                 text = self._clean_text(text)
                 
                 if not text.strip():
@@ -107,6 +125,26 @@ class DocumentIngester:
         
         return chunks
     
+    @staticmethod
+    def _pdf_page_texts(file_path: Path):
+        """Yield the raw text of each PDF page, via PDFium when available."""
+        if not HAS_PDFIUM:
+            for page in PdfReader(str(file_path)).pages:
+                yield page.extract_text() or ""
+            return
+        
+        pdf = pdfium.PdfDocument(str(file_path))
+        try:
+            for page in pdf:
+                textpage = page.get_textpage()
+                try:
+                    yield textpage.get_text_range()
+                finally:
+                    textpage.close()
+                    page.close()
+        finally:
+            pdf.close()
+    
     def ingest_pptx(self, file_path: Path, course_id: int = None) -> List[DocumentChunk]:
         """Extract and chunk content from PowerPoint."""
         if not HAS_PPTX:
@@ -229,29 +267,51 @@ class DocumentIngester:
         
         return chunks
     
-    def ingest_directory(self, dir_path: Path, 
-                         course_id: int = None) -> List[DocumentChunk]:
-        """Ingest all supported files in a directory."""
+    def ingest_directory(self, dir_path: Path, course_id: int = None,
+                         workers: int = None) -> List[DocumentChunk]:
+        """Ingest all supported files in a directory (see iter_directory)."""
+        return list(self.iter_directory(dir_path, course_id, workers))
+    
+    def iter_directory(self, dir_path: Path, course_id: int = None,
+                       workers: int = None) -> Iterator[DocumentChunk]:
+        """
+        Yield the chunks of all supported files in a directory, file by file,
+        so a consumer such as VectorRetriever.add_documents can embed them
+        without the whole directory held in memory.
+        
+        With more than one worker (default INGEST_WORKERS), files are parsed
+        in separate processes; chunk IDs are then assigned here in file order,
+        exactly as a serial run would number them.
+        """
         dir_path = Path(dir_path)
-        all_chunks = []
         
         supported_extensions = ['.pdf', '.pptx', '.ppt', '.txt', '.json']
+        file_paths = [file_path for file_path in dir_path.iterdir()
+                      if file_path.suffix.lower() in supported_extensions]
         
-        for file_path in dir_path.iterdir():
-            if file_path.suffix.lower() in supported_extensions:
-                chunks = self.ingest_file(file_path, course_id)
-                all_chunks.extend(chunks)
-                print(f"Ingested {file_path.name}: {len(chunks)} chunks")
+        workers = min(workers or INGEST_WORKERS, len(file_paths))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(
+                    _ingest_one, file_paths, [course_id] * len(file_paths),
+                    [self.chunk_size] * len(file_paths), [self.chunk_overlap] * len(file_paths))
+                for file_path, chunks in zip(file_paths, results):
+                    for chunk in chunks:
+                        self.chunk_counter += 1
+                        chunk.id = f"chunk_{self.chunk_counter}"
+                    print(f"Ingested {file_path.name}: {len(chunks)} chunks")
+                    yield from chunks
+            return
         
-        return all_chunks
+        for file_path in file_paths:
+            chunks = self.ingest_file(file_path, course_id)
+            print(f"Ingested {file_path.name}: {len(chunks)} chunks")
+            yield from chunks
     
     def _clean_text(self, text: str) -> str:
         """Clean and normalize text."""
-        # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text)
-        # Remove special characters but keep basic punctuation
-        text = re.sub(r'[^\w\s.,;:!?\-\(\)\[\]\'\"]+', '', text)
-        return text.strip()
+        # Collapse whitespace, then remove special characters but keep basic punctuation
+        return _STRIP_RE.sub('', _WS_RE.sub(' ', text)).strip()
     
     def _create_chunks(self, text: str, source_file: str, source_type: str,
                        page_or_slide: int, course_id: int = None,
@@ -276,7 +336,10 @@ class DocumentIngester:
                 }
             ))
         else:
-            # Split into overlapping chunks
+            # Split into overlapping chunks; separator positions are found
+            # once, then each chunk end is a binary search per separator
+            boundaries = [(sep, [m.start() for m in pattern.finditer(text)])
+                          for sep, pattern in _SENTENCE_SEPS]
             start = 0
             while start < len(text):
                 end = start + self.chunk_size
@@ -284,11 +347,10 @@ class DocumentIngester:
                 # Try to end at a sentence boundary
                 if end < len(text):
                     # Look for sentence end within last 100 chars
-                    search_zone = text[end-100:end]
-                    for sep in ['. ', '! ', '? ', '\n']:
-                        last_sep = search_zone.rfind(sep)
-                        if last_sep != -1:
-                            end = end - 100 + last_sep + len(sep)
+                    for sep, positions in boundaries:
+                        i = bisect_right(positions, end - len(sep)) - 1
+                        if i >= 0 and positions[i] >= end - 100:
+                            end = positions[i] + len(sep)
                             break
                 
                 chunk_text = text[start:end].strip()
@@ -316,4 +378,20 @@ class DocumentIngester:
     
     def chunks_to_dict(self, chunks: List[DocumentChunk]) -> List[dict]:
         """Convert chunks to dictionaries for storage."""
-        return [asdict(chunk) for chunk in chunks]
+        # Built directly rather than with asdict(), which deep-copies every field
+        return [{
+            'id': chunk.id,
+            'content': chunk.content,
+            'source_file': chunk.source_file,
+            'source_type': chunk.source_type,
+            'page_or_slide': chunk.page_or_slide,
+            'course_id': chunk.course_id,
+            'topic_id': chunk.topic_id,
+            'metadata': dict(chunk.metadata)
+        } for chunk in chunks]
+
+
+def _ingest_one(file_path: Path, course_id: Optional[int], chunk_size: int,
+                chunk_overlap: int) -> List[DocumentChunk]:
+    """Parse one file in a worker process (IDs are reassigned by the caller)."""
+    return DocumentIngester(chunk_size, chunk_overlap).ingest_file(file_path, course_id)
@@ -3,12 +3,23 @@ Study Pilot AI - FAISS Vector Store Retriever
 Local vector search for RAG with citations
 """
 
+import os
+import re
 import json
 import numpy as np
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from typing import Iterable, List, Dict, Tuple, Optional
 from dataclasses import dataclass
 
+# orjson is optional; stdlib json is used without it
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
 # Try to import FAISS
 try:
     import faiss
@@ -16,7 +27,7 @@ try:
 except ImportError:
     HAS_FAISS = False
 
-from .embeddings import EmbeddingModel
+from .embeddings import EmbeddingModel, EmbeddingCache
 from .ingestion import DocumentChunk
 
 
@@ -34,17 +45,47 @@ class RetrievalResult:
     citation: str
 
 
+def _dumps(obj) -> bytes:
+    """Encode a metadata row as UTF-8 JSON."""
+    return orjson.dumps(obj) if HAS_ORJSON else json.dumps(obj).encode('utf-8')
+
+
+def _loads(raw):
+    """Decode JSON metadata (bytes or str)."""
+    return orjson.loads(raw) if HAS_ORJSON else json.loads(raw)
+
+
 class VectorRetriever:
     """
     FAISS-based vector store for semantic retrieval.
     Falls back to brute-force numpy search if FAISS not available.
     """
     
-    def __init__(self, index_path: Path = None, embedding_model: EmbeddingModel = None):
+    ADD_BATCH_SIZE = 256  # Chunks embedded and indexed per step in add_documents
+    QUERY_CACHE_SIZE = 1024  # Recent query embeddings kept by search
+    
+    # Citation format per source type; other types cite the file alone
+    CITATION_FORMATS = {
+        'pdf': "[{source}, Page {page}]",
+        'pptx': "[{source}, Slide {page}]",
+        'syllabus': "[{source}, Topic {page}]",
+    }
+    
+    # Past this many chunks, the exact flat index is swapped for an HNSW graph
+    FLAT_INDEX_MAX = 10_000
+    HNSW_M = 32
+    HNSW_EF_CONSTRUCTION = 200
+    HNSW_EF_SEARCH = 64
+    
+    def __init__(self, index_path: Path = None, embedding_model: EmbeddingModel = None,
+                 embedding_cache: EmbeddingCache = None):
         self.index_path = index_path or Path(__file__).parent.parent / "data" / "faiss_index"
         self.index_path.mkdir(parents=True, exist_ok=True)
         
         self.embedding_model = embedding_model or EmbeddingModel()
+        self.embedding_cache = embedding_cache  # Skips re-embedding unchanged chunks
+        # Per-instance so cached vectors never outlive this retriever's model
+        self._query_vector = lru_cache(maxsize=self.QUERY_CACHE_SIZE)(self._embed_query)
         
         self.index = None
         self.chunk_metadata: List[dict] = []
@@ -58,26 +99,46 @@ class VectorRetriever:
             # Use IndexFlatIP for inner product (cosine similarity with normalized vectors)
             self.index = faiss.IndexFlatIP(self.dimension)
         else:
-            # Fallback: store embeddings in numpy array
+            # Fallback: store embeddings in numpy array, as int8 codes
             self.index = None
-            self._embeddings = np.array([]).reshape(0, self.dimension)
+            self._embeddings = np.empty((0, self.dimension), dtype=np.int8)
+            self._embedding_buffer = None
+    
+    def _hnsw_from_flat(self, flat_index) -> "faiss.IndexHNSWFlat":
+        """Approximate (sublinear) index holding the same vectors as a flat one."""
+        index = faiss.IndexHNSWFlat(self.dimension, self.HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = self.HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = self.HNSW_EF_SEARCH
+        if flat_index.ntotal:
+            index.add(flat_index.reconstruct_n(0, flat_index.ntotal))
+        return index
     
     def _load_index(self):
         """Load existing index from disk, or create new one."""
         index_file = self.index_path / "index.faiss"
-        metadata_file = self.index_path / "metadata.json"
+        embeddings_file = self.index_path / "embeddings.npy"
         
-        if index_file.exists() and metadata_file.exists():
+        # The numpy fallback saves embeddings.npy rather than index.faiss
+        data_file = index_file if HAS_FAISS else embeddings_file
+        if data_file.exists() and self._metadata_file().exists():
             try:
                 if HAS_FAISS:
                     self.index = faiss.read_index(str(index_file))
                 else:
-                    embeddings_file = self.index_path / "embeddings.npy"
-                    if embeddings_file.exists():
-                        self._embeddings = np.load(embeddings_file)
+                    # int8 codes are memory-mapped, so pages load on demand and
+                    # are shared between workers; older float16 files are quantized
+                    stored = np.load(embeddings_file, mmap_mode='r')
+                    self._embeddings = (stored if stored.dtype == np.int8
+                                        else EmbeddingModel.quantize_int8(stored))
+                    self._embedding_buffer = None
                 
-                with open(metadata_file, 'r') as f:
-                    self.chunk_metadata = json.load(f)
+                metadata_file = self._metadata_file()
+                with open(metadata_file, 'rb') as f:
+                    if metadata_file.suffix == '.jsonl':
+                        self.chunk_metadata = [_loads(line) for line in f if line.strip()]
+                    else:
+                        # Legacy single JSON list; rewritten as JSONL on the next save
+                        self.chunk_metadata = _loads(f.read())
                 
                 print(f"Loaded index with {len(self.chunk_metadata)} chunks")
                 return
@@ -87,67 +148,134 @@ class VectorRetriever:
         self._create_index()
     
     def save_index(self):
-        """Save index to disk."""
-        index_file = self.index_path / "index.faiss"
-        metadata_file = self.index_path / "metadata.json"
+        """
+        Save index to disk.
+        
+        Vectors and metadata are both written to temporary files and then
+        swapped in, so row N of metadata.jsonl always describes vector N.
+        """
+        # Per-process names, so concurrent savers never share a temporary file
+        suffix = f".{os.getpid()}.tmp"
+        replacements = []
         
         if HAS_FAISS and self.index is not None:
-            faiss.write_index(self.index, str(index_file))
+            index_file = self.index_path / "index.faiss"
+            tmp_file = index_file.with_name(index_file.name + suffix)
+            faiss.write_index(self.index, str(tmp_file))
+            replacements.append((tmp_file, index_file))
         elif hasattr(self, '_embeddings'):
-            np.save(self.index_path / "embeddings.npy", self._embeddings)
-        
-        with open(metadata_file, 'w') as f:
-            json.dump(self.chunk_metadata, f)
+            # Never write in place: _embeddings may be a memory map of the
+            # current file, which must not be truncated
+            embeddings_file = self.index_path / "embeddings.npy"
+            tmp_file = embeddings_file.with_name(embeddings_file.name + suffix)
+            with open(tmp_file, 'wb') as f:
+                np.save(f, self._embeddings)
+            replacements.append((tmp_file, embeddings_file))
+        
+        metadata_file = self.index_path / "metadata.jsonl"
+        tmp_file = metadata_file.with_name(metadata_file.name + suffix)
+        with open(tmp_file, 'wb') as f:
+            f.write(b''.join(_dumps(row) + b'\n' for row in self.chunk_metadata))
+        replacements.append((tmp_file, metadata_file))
+        
+        for tmp_file, target in replacements:
+            os.replace(tmp_file, target)
+        (self.index_path / "metadata.json").unlink(missing_ok=True)
         
         print(f"Saved index with {len(self.chunk_metadata)} chunks")
     
-    def add_documents(self, chunks: List[DocumentChunk], save: bool = True):
+    def add_documents(self, chunks: Iterable[DocumentChunk], save: bool = True) -> int:
         """
         Add document chunks to the index.
         
         Args:
-            chunks: List of DocumentChunk objects
+            chunks: DocumentChunk objects; any iterable, consumed in batches
+                so a generator of chunks is never held in memory at once
             save: Whether to save index after adding
+            
+        Returns:
+            Number of chunks added
         """
-        if not chunks:
-            return
-        
-        # Extract text and metadata
-        texts = [chunk.content for chunk in chunks]
-        
-        # Generate embeddings
-        embeddings = self.embedding_model.embed_documents(texts)
-        
-        # Normalize for cosine similarity
-        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
-        norms[norms == 0] = 1  # Avoid division by zero
-        embeddings = embeddings / norms
-        embeddings = embeddings.astype(np.float32)
-        
-        # Add to index
-        if HAS_FAISS and self.index is not None:
-            self.index.add(embeddings)
-        else:
-            if len(self._embeddings) == 0:
-                self._embeddings = embeddings
+        chunks = iter(chunks)
+        added = []
+        count = 0
+        
+        # Embed, normalize and add in batches: FAISS indexes each batch as it
+        # is embedded, and normalization never copies more than one batch
+        while True:
+            batch = list(islice(chunks, self.ADD_BATCH_SIZE))
+            if not batch:
+                break
+            
+            # Large indexes search a graph instead of scanning every vector
+            if (HAS_FAISS and isinstance(self.index, faiss.IndexFlat)
+                    and self.index.ntotal + len(batch) > self.FLAT_INDEX_MAX):
+                self.index = self._hnsw_from_flat(self.index)
+            
+            texts = [chunk.content for chunk in batch]
+            embeddings = np.asarray(
+                self.embedding_model.embed_documents(texts, cache=self.embedding_cache),
+                dtype=np.float32)
+            
+            # Normalize for cosine similarity
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            norms[norms == 0] = 1  # Avoid division by zero
+            embeddings /= norms
+            
+            # Add to index
+            if HAS_FAISS and self.index is not None:
+                self.index.add(embeddings)
             else:
-                self._embeddings = np.vstack([self._embeddings, embeddings])
-        
-        # Store metadata
-        for chunk in chunks:
-            self.chunk_metadata.append({
-                'id': chunk.id,
-                'content': chunk.content,
-                'source_file': chunk.source_file,
-                'source_type': chunk.source_type,
-                'page_or_slide': chunk.page_or_slide,
-                'course_id': chunk.course_id,
-                'topic_id': chunk.topic_id,
-                'metadata': chunk.metadata
-            })
-        
-        if save:
+                added.append(EmbeddingModel.quantize_int8(embeddings))
+            
+            # Store metadata
+            for chunk in batch:
+                self.chunk_metadata.append({
+                    'id': chunk.id,
+                    'content': chunk.content,
+                    'source_file': chunk.source_file,
+                    'source_type': chunk.source_type,
+                    'page_or_slide': chunk.page_or_slide,
+                    'course_id': chunk.course_id,
+                    'topic_id': chunk.topic_id,
+                    'metadata': chunk.metadata
+                })
+            count += len(batch)
+        
+        if added:
+            self._append_embeddings(np.concatenate(added))
+        
+        if count and save:
             self.save_index()
+        return count
+    
+    def _append_embeddings(self, codes: np.ndarray):
+        """
+        Append int8 rows to the fallback matrix. _embeddings is a view of a
+        buffer that grows by doubling, so repeated adds copy O(N) in total.
+        """
+        rows = len(self._embeddings)
+        needed = rows + len(codes)
+        buffer = self._embedding_buffer
+        if buffer is None or needed > len(buffer):
+            capacity = max(needed, 2 * (len(buffer) if buffer is not None else rows))
+            buffer = np.empty((capacity, self.dimension), dtype=np.int8)
+            buffer[:rows] = self._embeddings
+            self._embedding_buffer = buffer
+        buffer[rows:needed] = codes
+        self._embeddings = buffer[:needed]
+    
+    def _metadata_file(self) -> Path:
+        """metadata.jsonl, or the metadata.json written by older versions."""
+        metadata_file = self.index_path / "metadata.jsonl"
+        legacy_file = self.index_path / "metadata.json"
+        return legacy_file if legacy_file.exists() and not metadata_file.exists() else metadata_file
+    
+    def _embed_query(self, query: str) -> bytes:
+        """Normalized float32 query embedding, as immutable bytes for caching."""
+        query_embedding = np.array(self.embedding_model.embed_query(query), dtype=np.float32)
+        query_embedding /= np.linalg.norm(query_embedding)
+        return query_embedding.tobytes()
     
     def search(self, query: str, top_k: int = 5, 
                course_id: int = None,
@@ -168,20 +296,21 @@ class VectorRetriever:
             return []
         
         # Embed query
-        query_embedding = self.embedding_model.embed_query(query)
-        query_embedding = query_embedding / np.linalg.norm(query_embedding)
-        query_embedding = query_embedding.astype(np.float32).reshape(1, -1)
+        query_embedding = np.frombuffer(self._query_vector(query), dtype=np.float32).reshape(1, -1)
+        k = min(top_k * 2, len(self.chunk_metadata))  # Candidates before filtering
         
         # Search
         if HAS_FAISS and self.index is not None:
             # FAISS search
-            scores, indices = self.index.search(query_embedding, min(top_k * 2, len(self.chunk_metadata)))
+            scores, indices = self.index.search(query_embedding, k)
             scores = scores[0]
             indices = indices[0]
         else:
             # Numpy fallback
-            similarities = np.dot(self._embeddings, query_embedding.T).flatten()
-            indices = np.argsort(similarities)[::-1][:top_k * 2]
+            similarities = EmbeddingModel.int8_similarity(self._embeddings, query_embedding)
+            # Select the candidates in linear time, then sort only those
+            indices = np.argpartition(-similarities, k - 1)[:k]
+            indices = indices[np.argsort(-similarities[indices])]
             scores = similarities[indices]
         
         # Build results with filtering
@@ -221,18 +350,8 @@ class VectorRetriever:
     
     def _generate_citation(self, meta: dict) -> str:
         """Generate a citation string for a chunk."""
-        source = meta['source_file']
-        source_type = meta['source_type']
-        page = meta['page_or_slide']
-        
-        if source_type == 'pdf':
-            return f"[{source}, Page {page}]"
-        elif source_type == 'pptx':
-            return f"[{source}, Slide {page}]"
-        elif source_type == 'syllabus':
-            return f"[{source}, Topic {page}]"
-        else:
-            return f"[{source}]"
+        citation_format = self.CITATION_FORMATS.get(meta['source_type'], "[{source}]")
+        return citation_format.format(source=meta['source_file'], page=meta['page_or_slide'])
     
     def search_with_context(self, query: str, top_k: int = 3,
                             course_id: int = None) -> Dict:
@@ -301,6 +420,14 @@ class AnswerGenerator:
         'not_found': "I couldn't find information about this in the course materials. The query '{query}' doesn't match any content in the indexed documents."
     }
     
+    # Query phrases selecting each template, checked in order of precedence;
+    # one compiled alternation per template instead of a substring test per phrase
+    TEMPLATE_PATTERNS = (
+        ('definition', re.compile('what is|define|definition')),
+        ('procedure', re.compile('how to|steps|procedure')),
+        ('comparison', re.compile('compare|difference|vs')),
+    )
+    
     def __init__(self, retriever: VectorRetriever):
         self.retriever = retriever
     
@@ -324,14 +451,9 @@ class AnswerGenerator:
         
         # Determine answer type based on query
         query_lower = query.lower()
-        if any(w in query_lower for w in ['what is', 'define', 'definition']):
-            template = self.ANSWER_TEMPLATES['definition']
-        elif any(w in query_lower for w in ['how to', 'steps', 'procedure']):
-            template = self.ANSWER_TEMPLATES['procedure']
-        elif any(w in query_lower for w in ['compare', 'difference', 'vs']):
-            template = self.ANSWER_TEMPLATES['comparison']
-        else:
-            template = self.ANSWER_TEMPLATES['explanation']
+        template_key = next((key for key, pattern in self.TEMPLATE_PATTERNS
+                             if pattern.search(query_lower)), 'explanation')
+        template = self.ANSWER_TEMPLATES[template_key]
         
         # Format citations
         citation_str = ', '.join([c['citation'] for c in search_result['citations']])
@@ -0,0 +1,21 @@
+# Gunicorn configuration (loaded automatically from the working directory)
+
+
+def on_starting(server):
+    """
+    Seed demo courses and warm read-only caches once in the master process,
+    before workers fork (requires --preload to be shared with workers).
+    """
+    import app  # noqa: F401 - puts backend/ on sys.path
+    from backend.app import init_demo_data, warm_components
+    import database
+    init_demo_data()
+    warm_components()
+    # SQLite connections must not be carried across fork()
+    database.close_connection()
+
+
+def post_fork(server, worker):
+    """Guard: never use, or close, a SQLite connection inherited from the master."""
+    import database
+    database.discard_connection()
@@ -0,0 +1,29 @@
+"""
+Shared pytest setup: backend modules are imported from backend/, and
+the database never touches the shipped study_pilot.db.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+# database creates or migrates its file on import; keep that off the shipped DB
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'import.db')
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """The database module, pointed at a fresh file for one test."""
+    import database
+
+    database.close_connection()
+    monkeypatch.setattr(database, 'DATABASE_PATH', tmp_path / 'test.db')
+    # Keep PBKDF2 fast; the stored hash records its own iteration count
+    monkeypatch.setattr(database, 'PBKDF2_ITERATIONS', 1_000)
+    database.init_database()
+    yield database
+    database.close_connection()
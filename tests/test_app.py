@@ -0,0 +1,42 @@
+"""
+Tests for backend/app.py response encoding.
+"""
+
+import dataclasses
+import datetime
+import decimal
+import uuid
+
+import pytest
+from flask.json.provider import DefaultJSONProvider
+
+import app as backend_app
+
+
+@dataclasses.dataclass
+class Point:
+    x: int
+    y: float
+
+
+PAYLOAD = {
+    'created_at': datetime.datetime(2024, 3, 5, 14, 30, 7),
+    'aware': datetime.datetime(2024, 3, 5, 14, 30, 7, tzinfo=datetime.timezone.utc),
+    'day': datetime.date(2024, 3, 5),
+    'amount': decimal.Decimal('12.50'),
+    'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+    'point': Point(1, 2.5),
+    'nested': {2: ['a', None, True], 1: 0.25},
+}
+
+
+def test_orjson_provider_matches_flask_default():
+    if not backend_app.HAS_ORJSON:
+        pytest.skip("orjson not installed")
+    app = backend_app.app
+    assert isinstance(app.json, backend_app.ORJSONProvider)
+
+    encoded = app.json.loads(app.json.dumps(PAYLOAD))
+    expected = app.json.loads(DefaultJSONProvider(app).dumps(PAYLOAD))
+    assert encoded == expected
+    assert encoded['created_at'] == 'Tue, 05 Mar 2024 14:30:07 GMT'
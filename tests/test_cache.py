@@ -0,0 +1,70 @@
+"""
+Tests for backend/cache.py.
+"""
+
+import pytest
+
+import cache
+from cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(cache.time, 'monotonic', fake)
+    return fake
+
+
+def test_ttl_cache_expiry(clock):
+    ttl_cache = TTLCache(maxsize=4, ttl=60)
+    ttl_cache.set('key', {'id': 1})
+
+    clock.now += 59
+    assert ttl_cache.get('key') == {'id': 1}
+
+    clock.now += 1
+    assert ttl_cache.get('key') is None
+    assert ttl_cache.get('key', 'missing') == 'missing'
+    assert len(ttl_cache) == 0
+
+
+def test_ttl_cache_set_refreshes_expiry(clock):
+    ttl_cache = TTLCache(maxsize=4, ttl=60)
+    ttl_cache.set('key', 1)
+    clock.now += 30
+    ttl_cache.set('key', 2)
+
+    clock.now += 45
+    assert ttl_cache.get('key') == 2
+
+
+def test_ttl_cache_evicts_oldest(clock):
+    ttl_cache = TTLCache(maxsize=2, ttl=60)
+    ttl_cache.set('a', 1)
+    ttl_cache.set('b', 2)
+    ttl_cache.set('a', 3)  # re-inserting makes 'a' the newest
+    ttl_cache.set('c', 4)
+
+    assert len(ttl_cache) == 2
+    assert ttl_cache.get('b') is None
+    assert ttl_cache.get('a') == 3
+    assert ttl_cache.get('c') == 4
+
+
+def test_ttl_cache_pop_and_clear(clock):
+    ttl_cache = TTLCache(maxsize=4, ttl=60)
+    ttl_cache.set('a', 1)
+    ttl_cache.set('b', 2)
+
+    assert ttl_cache.pop('a') == 1
+    assert ttl_cache.pop('a', 'gone') == 'gone'
+    ttl_cache.clear()
+    assert len(ttl_cache) == 0
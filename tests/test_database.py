@@ -0,0 +1,100 @@
+"""
+Tests for backend/database.py storage helpers.
+"""
+
+import pytest
+
+import database
+
+
+# ============ Packed JSON columns ============
+
+@pytest.mark.parametrize('value', [
+    {'questions': [{'id': 1, 'options': ['a', 'b']}], 'score': 0.5},
+    ['réponse', '答案', ''],
+    [],
+])
+def test_pack_unpack_round_trip(value):
+    packed = database._pack_json(value)
+    assert isinstance(packed, bytes)
+    assert packed[:1] in (database._BLOB_ZLIB, database._BLOB_ZSTD)
+    assert database._loads(database._unpack_json(packed)) == value
+
+
+def test_unpack_legacy_text_row():
+    text = '{"legacy": true, "items": [1, 2, 3]}'
+    assert database._unpack_json(text) == text
+    assert database._unpack_json(None) is None
+
+
+def test_quiz_columns_round_trip(temp_db):
+    user = temp_db.create_user('Ana', 'ana@example.com', 'secret')
+    questions = [{'id': 1, 'question': 'Q?', 'options': None, 'correct_answer': 'True'}]
+
+    quiz_id = temp_db.save_quiz(user['id'], 1, questions)
+    temp_db.submit_quiz(quiz_id, ['true'], 1.0)
+
+    row = temp_db.get_connection().execute(
+        "SELECT questions_json, responses_json FROM quiz_history WHERE id = ?", (quiz_id,)
+    ).fetchone()
+    assert all(isinstance(column, bytes) for column in row)
+    assert database._loads(database._unpack_json(row[0])) == questions
+    assert database._loads(database._unpack_json(row[1])) == ['true']
+
+
+def test_legacy_text_columns_still_readable(temp_db):
+    user = temp_db.create_user('Ben', 'ben@example.com', 'secret')
+    conn = temp_db.get_connection()
+    with conn:
+        cursor = conn.execute(
+            "INSERT INTO quiz_history (user_id, course_id, questions_json) VALUES (?, ?, ?)",
+            (user['id'], 1, '[{"id": 7}]')
+        )
+
+    quiz = temp_db.get_quiz_by_id(user['id'], cursor.lastrowid)
+    assert quiz['questions_json'] == '[{"id": 7}]'
+    assert quiz['responses_json'] is None
+
+
+def test_study_plan_round_trip(temp_db):
+    user = temp_db.create_user('Cy', 'cy@example.com', 'secret')
+    plan = {'weeks': [{'week': 1, 'topics': ['Kinematics']}], 'hours': 6.5}
+
+    temp_db.save_study_plan(user['id'], 1, plan)
+    assert temp_db.get_latest_study_plan(user['id'], 1)['plan'] == plan
+
+
+# ============ Password hashes ============
+
+def test_legacy_hash_upgraded_on_login(temp_db):
+    conn = temp_db.get_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO users (name, email, password_hash, api_key, api_key_hash) VALUES (?, ?, ?, ?, ?)",
+            ('Old', 'old@example.com', temp_db._legacy_hash_password('hunter2'),
+             'old-key', temp_db.hash_api_key('old-key'))
+        )
+
+    assert temp_db.authenticate_user('old@example.com', 'wrong') is None
+    user = temp_db.authenticate_user('old@example.com', 'hunter2')
+    assert user['api_key'] == 'old-key'
+    assert 'password_hash' not in user
+
+    stored = conn.execute(
+        "SELECT password_hash FROM users WHERE email = ?", ('old@example.com',)
+    ).fetchone()[0]
+    assert not temp_db._needs_rehash(stored)
+    assert stored != temp_db._legacy_hash_password('hunter2')
+    assert temp_db.verify_password('hunter2', stored)
+    assert not temp_db.verify_password('wrong', stored)
+
+    # The upgraded hash keeps working for later logins
+    assert temp_db.authenticate_user('old@example.com', 'hunter2')['id'] == user['id']
+
+
+def test_new_hashes_are_salted(temp_db):
+    first, second = temp_db.hash_password('same'), temp_db.hash_password('same')
+    assert first != second
+    assert temp_db.verify_password('same', first)
+    assert temp_db.verify_password('same', second)
+    assert not temp_db._needs_rehash(first)
@@ -0,0 +1,134 @@
+"""
+Tests for backend/rag/embeddings.py EmbeddingCache: the float16
+memory-mapped rows, the next_row counter shared through one directory,
+and the metadata flush at exit.
+"""
+
+import gc
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+
+import numpy as np
+import pytest
+
+from rag import embeddings
+from rag.embeddings import EmbeddingCache
+
+DIM = 8
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), '..', 'backend')
+
+
+def vector(seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+
+
+def assert_close(actual, expected):
+    # float16 keeps about 3 significant digits
+    np.testing.assert_allclose(actual, expected, rtol=1e-3, atol=1e-3)
+
+
+def test_reopen_returns_same_vectors(tmp_path):
+    cache = EmbeddingCache(tmp_path, dim=DIM)
+    for i in range(10):
+        cache.set(f"key{i}", vector(i), text_hash=f"hash{i}")
+    cache.flush()
+
+    reopened = EmbeddingCache(tmp_path, dim=DIM)
+    for i in range(10):
+        assert reopened.has(f"key{i}", f"hash{i}")
+        assert not reopened.has(f"key{i}", "stale")
+        cached = reopened.get(f"key{i}")
+        assert cached.dtype == np.float32
+        assert_close(cached, vector(i))
+
+
+def test_set_keeps_embedding_shape(tmp_path):
+    cache = EmbeddingCache(tmp_path, dim=DIM)
+    cache.set('row', vector(0).reshape(1, DIM))
+    assert cache.get('row').shape == (1, DIM)
+
+    with pytest.raises(ValueError):
+        cache.set('short', np.zeros(DIM - 1))
+
+
+def test_two_instances_share_a_directory(tmp_path, monkeypatch):
+    # Small data file, so the instances grow it under each other
+    monkeypatch.setattr(EmbeddingCache, 'INITIAL_ROWS', 4)
+    first = EmbeddingCache(tmp_path, dim=DIM)
+    second = EmbeddingCache(tmp_path, dim=DIM)
+
+    for i in range(0, 40, 2):
+        first.set(f"key{i}", vector(i))
+        second.set(f"key{i + 1}", vector(i + 1))
+
+    # Each row is handed out once, across both instances
+    rows = [first.metadata[f"key{i}"]['row'] for i in range(0, 40, 2)]
+    rows += [second.metadata[f"key{i}"]['row'] for i in range(1, 40, 2)]
+    assert sorted(rows) == list(range(40))
+    assert (tmp_path / EmbeddingCache.NEXT_ROW_FILE).read_text() == '40'
+
+    first.flush()
+    second.flush()
+    reopened = EmbeddingCache(tmp_path, dim=DIM)
+    assert len(reopened.metadata) == 40
+    for i in range(40):
+        assert_close(reopened.get(f"key{i}"), vector(i))
+
+
+def test_threads_share_one_instance(tmp_path):
+    cache = EmbeddingCache(tmp_path, dim=DIM)
+
+    def fill(start):
+        for i in range(start, start + 50):
+            cache.set(f"key{i}", vector(i))
+
+    threads = [threading.Thread(target=fill, args=(start,)) for start in range(0, 200, 50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(info['row'] for info in cache.metadata.values()) == list(range(200))
+    for i in range(200):
+        assert_close(cache.get(f"key{i}"), vector(i))
+
+
+def test_metadata_flushed_at_exit(tmp_path):
+    script = textwrap.dedent(f"""
+        import sys
+        sys.path.insert(0, {BACKEND_DIR!r})
+        import numpy as np
+        from pathlib import Path
+        from rag.embeddings import EmbeddingCache
+
+        cache = EmbeddingCache(Path({str(tmp_path)!r}), dim={DIM})
+        cache.set('exit', np.arange({DIM}, dtype=np.float32))
+    """)
+    subprocess.run([sys.executable, '-c', script], check=True)
+
+    reopened = EmbeddingCache(tmp_path, dim=DIM)
+    assert_close(reopened.get('exit'), np.arange(DIM, dtype=np.float32))
+
+
+def test_open_caches_do_not_keep_instances_alive(tmp_path):
+    cache = EmbeddingCache(tmp_path, dim=DIM)
+    assert cache in embeddings._OPEN_CACHES
+
+    del cache
+    gc.collect()
+    assert not any(c.cache_dir == tmp_path for c in embeddings._OPEN_CACHES)
+
+
+def test_clear_restarts_rows(tmp_path):
+    cache = EmbeddingCache(tmp_path, dim=DIM)
+    cache.set('old', vector(0))
+    cache.clear()
+
+    assert cache.get('old') is None
+    cache.set('new', vector(1))
+    assert cache.metadata['new']['row'] == 0
+    cache.flush()
+    assert_close(EmbeddingCache(tmp_path, dim=DIM).get('new'), vector(1))
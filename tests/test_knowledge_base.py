@@ -0,0 +1,84 @@
+"""
+Tests for backend/knowledge_base.py topic matching. The trie and
+Aho-Corasick lookups must pick the same topic as the original linear
+scan, including ties (the earliest KB entry wins).
+"""
+
+from itertools import product
+
+import pytest
+
+from knowledge_base import KNOWLEDGE_BASE, _match_topic, get_smart_answer
+
+
+def baseline_match(query: str):
+    """The original scan over every KB topic."""
+    query_lower = query.lower()
+    if query_lower in KNOWLEDGE_BASE:
+        return query_lower
+
+    best_key = None
+    best_score = 0
+    words = query_lower.split()
+    for topic in KNOWLEDGE_BASE:
+        score = 0
+        if topic in query_lower:
+            score += 50
+        for word in words:
+            if len(word) > 3 and word in topic:
+                score += 10
+        if score > best_score and score > 15:
+            best_score = score
+            best_key = topic
+    return best_key
+
+
+@pytest.mark.parametrize('query, expected', [
+    # Direct and phrase matches
+    ('heap', 'heap'),
+    ('Z Transform ROC', 'z transform roc'),
+    ('What is a Binary Tree?', 'binary tree'),
+    ('how does dijkstra work', 'dijkstra'),
+    ('convolution types of convolution', 'convolution types'),
+    # Ties: the earliest KB entry wins
+    ('explain merge sort and quick sort', 'merge sort'),
+    ('fourier transform vs laplace transform', 'fourier transform'),
+    ('zeroth law and first law', 'zeroth law'),
+    ('carnot cycle or otto cycle', 'carnot cycle'),
+    ('iir filter vs fir filter', 'fir filter'),
+    ('compare bfs and dfs', 'bfs'),
+    ('z transform roc region', 'z transform'),
+    ('process vs thread in an operating system', 'operating system'),
+    # Keyword-only ties
+    ('cycle cycle', 'carnot cycle'),
+    ('transform transform', 'fourier transform'),
+    # Below the score threshold
+    ('tree', None),
+    ('fourier', None),
+    ('sorting', None),
+    ('', None),
+])
+def test_match_topic_table(query, expected):
+    assert baseline_match(query) == expected
+    assert _match_topic(query.lower()) == expected
+
+
+def test_match_topic_agrees_on_topic_pairs():
+    topics = list(KNOWLEDGE_BASE)
+    for first, second in product(topics, repeat=2):
+        for query in (f"{first} vs {second}", f"explain {first} {second}"):
+            assert _match_topic(query) == baseline_match(query), query
+
+
+@pytest.mark.parametrize('topic', list(KNOWLEDGE_BASE))
+def test_match_topic_agrees_on_topic_words(topic):
+    for word in topic.split():
+        for query in (word, f"what is {word}", f"{word} {word}"):
+            assert _match_topic(query) == baseline_match(query), query
+
+
+def test_get_smart_answer():
+    answer = get_smart_answer('Explain Merge Sort and Quick Sort')
+    assert answer['answer'] == KNOWLEDGE_BASE['merge sort']
+    assert answer['citations'][0]['citation'] == 'Study Pilot Knowledge Base: Merge Sort'
+    assert get_smart_answer('tree') is None
@@ -0,0 +1,93 @@
+"""
+Tests for backend/engines/mastery.py, checked against the original
+per-response BKT formula.
+"""
+
+import numpy as np
+import pytest
+
+from engines import mastery
+from engines.mastery import BayesianKnowledgeTracer, BKTParams
+
+
+def baseline_update(p_mastery, correct, params):
+    """The BKT update as originally written, one response at a time."""
+    if correct:
+        numerator = (1 - params.p_slip) * p_mastery
+        denominator = numerator + params.p_guess * (1 - p_mastery)
+    else:
+        numerator = params.p_slip * p_mastery
+        denominator = numerator + (1 - params.p_guess) * (1 - p_mastery)
+    posterior = numerator / denominator if denominator > 0 else p_mastery
+    return max(0.0, min(1.0, posterior + (1 - posterior) * params.p_learn))
+
+
+def baseline_sequence(responses, p_init, params):
+    history = [p_init]
+    for correct in responses:
+        history.append(baseline_update(history[-1], correct, params))
+    return history
+
+
+RESPONSES = [True, False, True, True, False, False, True, True, True, False, True, True]
+
+PARAMS = [
+    BKTParams(),
+    BKTParams(p_init=0.4, p_learn=0.1, p_guess=0.2, p_slip=0.05),
+    # Degenerate likelihoods: zero denominators keep the prior mastery
+    BKTParams(p_init=0.0, p_learn=0.0, p_guess=0.0, p_slip=0.0),
+]
+
+
+@pytest.mark.parametrize('params', PARAMS)
+@pytest.mark.parametrize('p_init', [None, 0.0, 0.5, 1.0])
+def test_update_from_sequence_matches_baseline(monkeypatch, params, p_init):
+    monkeypatch.setattr(mastery, 'HAS_NUMBA', False)
+    tracer = BayesianKnowledgeTracer(params)
+
+    final, history = tracer.update_from_sequence(RESPONSES, p_init)
+
+    expected = baseline_sequence(RESPONSES, params.p_init if p_init is None else p_init, params)
+    assert history == pytest.approx(expected, abs=1e-12)
+    assert final == history[-1]
+
+
+@pytest.mark.parametrize('params', PARAMS)
+def test_update_mastery_matches_baseline(params):
+    tracer = BayesianKnowledgeTracer(params)
+    for p in np.linspace(0.0, 1.0, 21):
+        for correct in (True, False):
+            assert tracer.update_mastery(p, correct) == pytest.approx(
+                baseline_update(p, correct, params), abs=1e-12)
+
+
+def test_kernel_accepts_numpy_inputs():
+    """The numba path passes a bool array and a float64 history buffer."""
+    params = BKTParams()
+    history = np.empty(len(RESPONSES) + 1)
+
+    final = mastery._replay_responses(np.asarray(RESPONSES, dtype=np.bool_), 0.2,
+                                      params.p_guess, params.p_slip, params.p_learn, history)
+
+    expected = baseline_sequence(RESPONSES, 0.2, params)
+    assert history.tolist() == pytest.approx(expected, abs=1e-12)
+    assert final == pytest.approx(expected[-1], abs=1e-12)
+
+
+def test_numba_kernel_matches_baseline():
+    pytest.importorskip('numba')
+    assert mastery.HAS_NUMBA
+
+    params = BKTParams()
+    final, history = BayesianKnowledgeTracer(params).update_from_sequence(RESPONSES, 0.2)
+
+    expected = baseline_sequence(RESPONSES, 0.2, params)
+    assert history == pytest.approx(expected, abs=1e-12)
+    assert final == pytest.approx(expected[-1], abs=1e-12)
+
+
+def test_empty_sequence_returns_initial_mastery(monkeypatch):
+    monkeypatch.setattr(mastery, 'HAS_NUMBA', False)
+    final, history = BayesianKnowledgeTracer().update_from_sequence([], 0.3)
+    assert final == 0.3
+    assert history == [0.3]
@@ -0,0 +1,91 @@
+"""
+Tests for backend/engines/quiz.py adaptive sampling. Both weighted
+samplers run on the same bank: the Python A-ES loop and the NumPy path
+used for banks of NUMPY_SAMPLING_MIN_QUESTIONS or more.
+"""
+
+import json
+import random
+from collections import Counter
+
+import pytest
+
+from engines import quiz
+from engines.quiz import QuizGenerator
+
+QUESTIONS_PER_TOPIC = 300
+DIFFICULTIES = ('easy', 'medium', 'hard')
+
+# Topic 4 is in the bank but not in the mastery map, so it gets no weight
+TOPIC_MASTERY = {1: 0.0, 2: 0.5, 3: 0.9}
+
+
+@pytest.fixture
+def generator(tmp_path):
+    questions = [
+        {'id': f"t{topic}-q{i}", 'topic_id': topic, 'difficulty': DIFFICULTIES[i % 3],
+         'question_text': '?', 'question_type': 'short_answer', 'correct_answer': 'x'}
+        for topic in (1, 2, 3, 4) for i in range(QUESTIONS_PER_TOPIC)
+    ]
+    (tmp_path / 'test.json').write_text(json.dumps({'code': 'TEST', 'questions': questions}))
+    return QuizGenerator(tmp_path)
+
+
+@pytest.fixture(params=['python', 'numpy'])
+def sampler(request, generator):
+    """The generator, forced onto one sampling path."""
+    assert len(generator.question_banks['TEST']) >= quiz.NUMPY_SAMPLING_MIN_QUESTIONS
+    if request.param == 'python':
+        generator.question_arrays['TEST'] = None
+    else:
+        assert generator.question_arrays['TEST'] is not None
+    return generator
+
+
+@pytest.mark.parametrize('num_questions', [1, 10, 60])
+def test_returns_distinct_questions(sampler, num_questions):
+    random.seed(1234)
+    selected = sampler.generate_adaptive_quiz('TEST', TOPIC_MASTERY, num_questions)
+
+    ids = [q['id'] for q in selected]
+    assert len(ids) == num_questions
+    assert len(set(ids)) == num_questions
+
+
+def test_small_pool_returns_every_weighted_question(sampler):
+    random.seed(1234)
+    selected = sampler.generate_adaptive_quiz('TEST', {1: 0.0}, 10_000)
+
+    assert len(selected) == QUESTIONS_PER_TOPIC
+    assert {q['topic_id'] for q in selected} == {1}
+
+
+def test_topic_mix_follows_weights(sampler):
+    random.seed(1234)
+    topics = Counter()
+    topic_1_difficulty = Counter()
+    for _ in range(300):
+        for q in sampler.generate_adaptive_quiz('TEST', TOPIC_MASTERY, 10):
+            topics[q['topic_id']] += 1
+            if q['topic_id'] == 1:
+                topic_1_difficulty[q['difficulty']] += 1
+
+    # Topic weight is 1.1 - mastery
+    weights = {topic: 1.1 - mastery for topic, mastery in TOPIC_MASTERY.items()}
+    total = sum(topics.values())
+    assert topics[4] == 0
+    for topic, weight in weights.items():
+        assert topics[topic] / total == pytest.approx(weight / sum(weights.values()), abs=0.03)
+
+    # Topic 1 targets easy questions, weighted DIFFICULTY_MATCH_BONUS times the others
+    bonus = quiz.DIFFICULTY_MATCH_BONUS
+    easy_share = topic_1_difficulty['easy'] / sum(topic_1_difficulty.values())
+    assert easy_share == pytest.approx(bonus / (bonus + 2), abs=0.04)
+
+
+def test_seeded_sampling_is_reproducible(sampler):
+    random.seed(99)
+    first = [q['id'] for q in sampler.generate_adaptive_quiz('TEST', TOPIC_MASTERY, 10)]
+    random.seed(99)
+    second = [q['id'] for q in sampler.generate_adaptive_quiz('TEST', TOPIC_MASTERY, 10)]
+    assert first == second